@@ -1,35 +1,165 @@
+import json
 import logging
+import os
 import re
 import requests
 import time
 import traceback
-import uuid
 
+from batch_jobs import BatchJobQueue
 from bs4 import BeautifulSoup
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from crossref_harvest import bounded_map, iter_crossref_works
+from document_cache import DocumentCache, content_hash
 # from flair.models import SequenceTagger
 # from flair.data import Sentence
-from flask import Flask, request
+from flask import Flask, Response, g, request, stream_with_context
 from flask_cors import CORS
-from io import BytesIO
-from PyPDF2 import PdfReader
-import spacy
+from graph_store import GraphStore, node_id
+from http_client import CircuitBreaker, HostRateLimiter, HttpClient, parse_rate_limits
+from html_extraction import extract_text_from_html
+from lookup_cache import LookupCache, normalize_lookup_text
+from metrics import REGISTRY, REQUEST_SECONDS, collect_timings, count, stage, timed_iter
+from nlp_loader import load_ner_pipeline, process_memory_mb
+from pdf_extraction import iter_pdf_pages_text, start_pdf_executor
+from singleflight import CancelledCall, SingleFlight
+from text_normalizer import iter_paragraphs, linkable_text_length
+from wikidata_index import WikidataIndex
 
 app = Flask(__name__)
 # Enable CORS
 # CORS(app)
 CORS(app, resources={r"/*": {"origins": "http://localhost:3000", "methods": ["GET", "POST", "OPTIONS"], "supports_credentials": True}})
 
+# DEBUG logs every pipeline step; keep it off the request path in production
+logging.basicConfig(level=os.environ.get("LOG_LEVEL", "INFO").upper(), format='%(asctime)s - %(levelname)s - %(message)s')
+
 # Load the NER tagger
 # flair_ner_tagger = SequenceTagger.load("ner")
-nlp = spacy.load("en_core_web_lg")
-
-logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+# Loaded once, NER components only, from the prebuilt slim snapshot when available (see nlp_loader.py)
+SPACY_MODEL = os.environ.get("SPACY_MODEL", "en_core_web_lg")
+SPACY_SNAPSHOT_PATH = os.environ.get("SPACY_SNAPSHOT_PATH", "")
+nlp = load_ner_pipeline(SPACY_MODEL, SPACY_SNAPSHOT_PATH)
 
-newlines_pattern = re.compile(r' *[\n|\r|\r\n]+ *')
-whitespace_pattern = re.compile(r'[\t\f\v ]+')
-paragraph_split_pattern = re.compile(r'\n')
 doi_compiled_regex = re.compile(r'^10.\d{4,9}/[-._;()/:A-Z0-9]+$', re.IGNORECASE)
 
+DATA_DIR = os.environ.get("DATA_DIR", "data")
+
+# All outbound requests go through one client: pooled sessions, timeouts, a circuit breaker per
+# host, and per-host token buckets ("host=requests per second:burst") shared by every worker process
+HTTP_RATE_LIMITS = parse_rate_limits(os.environ.get(
+    "HTTP_RATE_LIMITS", "www.wikidata.org=5:10,query.wikidata.org=1:5,api.crossref.org=10:20"
+))
+HTTP_DEFAULT_RATE_LIMIT = parse_rate_limits(f"*={os.environ.get('HTTP_DEFAULT_RATE_LIMIT', '5:10')}")["*"]
+HTTP_CONNECT_TIMEOUT = float(os.environ.get("HTTP_CONNECT_TIMEOUT", 5))
+HTTP_READ_TIMEOUT = float(os.environ.get("HTTP_READ_TIMEOUT", 30))
+HTTP_MAX_RETRIES = int(os.environ.get("HTTP_MAX_RETRIES", 4))
+# A 429/503 asking clients to wait longer than this is returned instead of retried
+HTTP_MAX_RETRY_AFTER = float(os.environ.get("HTTP_MAX_RETRY_AFTER", 60))
+USER_AGENT = os.environ.get("USER_AGENT", os.environ.get("WIKIDATA_USER_AGENT", "spacy-nel/1.0 (https://github.com/fedevela/gcp-spacy-nel)"))
+http_client = HttpClient(
+    HostRateLimiter(os.environ.get("RATE_LIMIT_PATH", os.path.join(DATA_DIR, "rate_limits.sqlite3")), HTTP_RATE_LIMITS, HTTP_DEFAULT_RATE_LIMIT),
+    timeout=(HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT),
+    max_retries=HTTP_MAX_RETRIES,
+    max_retry_after=HTTP_MAX_RETRY_AFTER,
+    user_agent=USER_AGENT,
+    pool_size=int(os.environ.get("HTTP_POOL_SIZE", 16)),
+    circuit_breaker=CircuitBreaker(
+        failure_threshold=int(os.environ.get("HTTP_CIRCUIT_FAILURES", 5)),
+        reset_timeout=float(os.environ.get("HTTP_CIRCUIT_RESET_SECONDS", 30)),
+    ),
+)
+
+# Base URLs of the services the app calls; bench/stub_server.py stands in for all of them offline
+WIKIDATA_API_URL = os.environ.get("WIKIDATA_API_URL", "https://www.wikidata.org/w/api.php")
+WIKIDATA_SPARQL_URL = os.environ.get("WIKIDATA_SPARQL_URL", "https://query.wikidata.org/sparql")
+CROSSREF_API_URL = os.environ.get("CROSSREF_API_URL", "https://api.crossref.org").rstrip("/")
+DOI_RESOLVER_URL = os.environ.get("DOI_RESOLVER_URL", "https://doi.org").rstrip("/")
+
+# Concurrent identical requests share one in-flight computation (see singleflight.py); a request
+# waits at most DOCUMENT_FLIGHT_WAIT_SECONDS for another's document before building it itself
+document_flight = SingleFlight("documents")
+DOCUMENT_FLIGHT_WAIT_SECONDS = float(os.environ.get("DOCUMENT_FLIGHT_WAIT_SECONDS", 120))
+wikidata_search_flight = SingleFlight("wikidata_search")
+
+# Wikidata lookup cache: in-process LRU in front of a SQLite file that survives restarts
+LOOKUP_CACHE_PATH = os.environ.get("LOOKUP_CACHE_PATH", os.path.join(DATA_DIR, "lookup_cache.sqlite3"))
+# Each namespace of the file keeps at most this many rows; expired rows are purged every LOOKUP_CACHE_PURGE_EVERY stores
+LOOKUP_CACHE_DISK_ENTRIES = int(os.environ.get("LOOKUP_CACHE_DISK_ENTRIES", 2_000_000))
+LOOKUP_CACHE_PURGE_EVERY = int(os.environ.get("LOOKUP_CACHE_PURGE_EVERY", 1000))
+WIKIDATA_LANGUAGE = os.environ.get("WIKIDATA_LANGUAGE", "en")
+wikidata_cache = LookupCache(
+    path=LOOKUP_CACHE_PATH,
+    namespace="wikidata",
+    ttl=int(os.environ.get("WIKIDATA_CACHE_TTL", 30 * 24 * 3600)),  # 30 days
+    negative_ttl=int(os.environ.get("WIKIDATA_CACHE_NEGATIVE_TTL", 24 * 3600)),  # 1 day
+    max_memory_entries=int(os.environ.get("WIKIDATA_CACHE_MEMORY_ENTRIES", 50000)),
+    max_disk_entries=LOOKUP_CACHE_DISK_ENTRIES,
+    purge_every=LOOKUP_CACHE_PURGE_EVERY,
+)
+
+# Document-level result cache: graphs per URL/DOI, revalidated with ETag/Last-Modified and a content hash
+document_cache = DocumentCache(
+    path=os.environ.get("DOCUMENT_CACHE_PATH", os.path.join(DATA_DIR, "document_cache.sqlite3")),
+    max_bytes=int(os.environ.get("DOCUMENT_CACHE_MAX_BYTES", 512 * 1024 * 1024)),
+)
+
+# Document fetching limits and PDF page extraction (0 pages means no limit)
+DOCUMENT_MAX_BYTES = int(os.environ.get("DOCUMENT_MAX_BYTES", 50 * 1024 * 1024))
+PDF_MAX_PAGES = int(os.environ.get("PDF_MAX_PAGES", 0))
+PDF_EXTRACTION_WORKERS = int(os.environ.get("PDF_EXTRACTION_WORKERS", min(4, os.cpu_count() or 1)))
+# HTML pages: keep only the main article element when this is true (off by default; requests can
+# override it with main_content)
+HTML_MAIN_CONTENT = os.environ.get("HTML_MAIN_CONTENT", "false").lower() == "true"
+
+# CrossRef metadata cache; /doi2graph builds graphs from the CrossRef abstract unless full_text is requested
+ABSTRACT_NOT_AVAILABLE = 'Abstract not available.'
+crossref_cache = LookupCache(
+    path=LOOKUP_CACHE_PATH,
+    namespace="crossref",
+    ttl=int(os.environ.get("CROSSREF_CACHE_TTL", 7 * 24 * 3600)),  # 7 days (citation counts drift)
+    negative_ttl=int(os.environ.get("CROSSREF_CACHE_NEGATIVE_TTL", 24 * 3600)),
+    max_memory_entries=int(os.environ.get("CROSSREF_CACHE_MEMORY_ENTRIES", 10000)),
+    max_disk_entries=LOOKUP_CACHE_DISK_ENTRIES,
+    purge_every=LOOKUP_CACHE_PURGE_EVERY,
+)
+
+# Keyword harvesting: CrossRef result pages (up to 1000 works each) are prefetched in the
+# background while up to CROSSREF_HARVEST_WORKERS works are turned into graphs
+CROSSREF_HARVEST_ROWS = int(os.environ.get("CROSSREF_HARVEST_ROWS", 1000))
+CROSSREF_HARVEST_MAX_RESULTS = int(os.environ.get("CROSSREF_HARVEST_MAX_RESULTS", 10000))
+CROSSREF_HARVEST_PREFETCH_PAGES = int(os.environ.get("CROSSREF_HARVEST_PREFETCH_PAGES", 1))
+CROSSREF_HARVEST_WORKERS = int(os.environ.get("CROSSREF_HARVEST_WORKERS", 4))
+# Works returned as one JSON list by /get_dois_and_citation_counts_by_keyword; stream for more
+CROSSREF_LIST_MAX_RESULTS = int(os.environ.get("CROSSREF_LIST_MAX_RESULTS", 1000))
+CROSSREF_MAILTO = os.environ.get("CROSSREF_MAILTO")
+_harvest_executor = None
+_harvest_executor_pid = None
+
+# Entity linking concurrency: maximum number of Wikidata lookups in flight per process
+NEL_MAX_WORKERS = int(os.environ.get("NEL_MAX_WORKERS", 8))
+_linking_executor = None
+_linking_executor_pid = None
+
+# Linking backend: 'remote' queries the Wikidata API, 'local' resolves against the memory-mapped
+# label/alias index built by wikidata_index.py and only goes to the API on a miss
+LINKING_BACKEND = os.environ.get("LINKING_BACKEND", "remote")
+WIKIDATA_INDEX_PATH = os.environ.get("WIKIDATA_INDEX_PATH", os.path.join(DATA_DIR, "wikidata.idx"))
+local_wikidata_index = WikidataIndex(WIKIDATA_INDEX_PATH) if LINKING_BACKEND == "local" else None
+
+# Type-aware linking: how many search candidates to re-rank, and the class membership cache
+WIKIDATA_CANDIDATE_LIMIT = int(os.environ.get("WIKIDATA_CANDIDATE_LIMIT", 5))
+WIKIDATA_CLASS_BATCH_SIZE = 50
+wikidata_class_cache = LookupCache(
+    path=LOOKUP_CACHE_PATH,
+    namespace="wikidata_class",
+    ttl=int(os.environ.get("WIKIDATA_CACHE_TTL", 30 * 24 * 3600)),
+    max_memory_entries=int(os.environ.get("WIKIDATA_CACHE_MEMORY_ENTRIES", 50000)),
+    max_disk_entries=LOOKUP_CACHE_DISK_ENTRIES,
+    purge_every=LOOKUP_CACHE_PURGE_EVERY,
+)
+
 # ner_type_to_wikidata_qid = {
 #     'PER': 'Q5',        # human
 #     'LOC': 'Q618123',   # geographical object
@@ -57,14 +187,46 @@ ner_type_to_wikidata_qid = {
     'CARDINAL': 'Q21199',      # cardinal number
 }
 
+# Streaming NER: cleaned paragraphs are fed to nlp.pipe as they arrive, cut at NER_CHUNK_CHARS characters
+NER_CHUNK_CHARS = int(os.environ.get("NER_CHUNK_CHARS", 20000))
+NER_BATCH_SIZE = int(os.environ.get("NER_BATCH_SIZE", 16))
+NER_N_PROCESS = int(os.environ.get("NER_N_PROCESS", 1))
 
-# Initialize the Flask app
+# Incremental NER: entities are cached per cleaned paragraph, keyed by the paragraph's hash and the
+# model, so a re-fetched document that changed slightly only sends new paragraphs through spaCy
+NER_MODEL_ID = f"{nlp.meta.get('lang', '')}_{nlp.meta.get('name', SPACY_MODEL)}-{nlp.meta.get('version', '')}"
+ner_cache = LookupCache(
+    path=LOOKUP_CACHE_PATH,
+    namespace="ner",
+    ttl=int(os.environ.get("NER_CACHE_TTL", 90 * 24 * 3600)),
+    max_memory_entries=int(os.environ.get("NER_CACHE_MEMORY_ENTRIES", 20000)),
+    max_disk_entries=LOOKUP_CACHE_DISK_ENTRIES,
+    purge_every=LOOKUP_CACHE_PURGE_EVERY,
+)
 
-app = Flask(__name__)
+# Values rather than things: Wikidata has no useful item for "3 percent" or "last Tuesday"
+UNLINKABLE_ENTITY_TYPES = {'DATE', 'TIME', 'PERCENT', 'MONEY', 'QUANTITY', 'ORDINAL', 'CARDINAL'}
+
+# Every graph built is also merged into one persistent graph (see graph_store.py)
+GRAPH_STORE_PATH = os.environ.get("GRAPH_STORE_PATH", os.path.join(DATA_DIR, "graph.sqlite3"))
+graph_store = GraphStore(GRAPH_STORE_PATH)
+# Rows returned by the /graph queries; larger ?limit values are clamped
+GRAPH_QUERY_DEFAULT_LIMIT = int(os.environ.get("GRAPH_QUERY_DEFAULT_LIMIT", 100))
+GRAPH_QUERY_MAX_LIMIT = int(os.environ.get("GRAPH_QUERY_MAX_LIMIT", 1000))
+
+# Prometheus histograms: every worker process adds its observations to this file (at most
+# METRICS_FLUSH_SECONDS late), so a scrape of any worker reports the whole server
+METRICS_PATH = os.environ.get("METRICS_PATH", os.path.join(DATA_DIR, "metrics.sqlite3"))
+REGISTRY.use_store(METRICS_PATH, float(os.environ.get("METRICS_FLUSH_SECONDS", 5)))
+
+# Batch jobs run in-process on their own thread pool; their state is kept in files (see batch_jobs.py)
+BATCH_JOBS_PATH = os.environ.get("BATCH_JOBS_PATH", os.path.join(DATA_DIR, "jobs"))
+BATCH_WORKERS = int(os.environ.get("BATCH_WORKERS", 4))
+BATCH_MAX_ITEMS = int(os.environ.get("BATCH_MAX_ITEMS", 1000))
+# Items are linked together in groups of this size; distinct forms are still looked up once per job
+BATCH_LINK_GROUP_SIZE = int(os.environ.get("BATCH_LINK_GROUP_SIZE", 50))
+batch_job_id_pattern = re.compile(r'^[0-9a-f]{32}$')
 
-# Load the spaCy model with NEL
-nlp = spacy.load("en_core_web_lg")
-    
 # Regular expression for validating DOI
 doi_pattern = re.compile(r'^10.\d{4,9}/[-._;()/:A-Z0-9]+$', re.IGNORECASE)
 
@@ -73,49 +235,152 @@ def perform_ner_with_text(sentence_text):
     Performs Named Entity Recognition (NER) on the given text using Spacy.
 
     Args:
-        sentence_text (str): The text to perform NER on.
+        sentence_text (str or iterable): The text to perform NER on, or an iterable of texts
+            (e.g. PDF pages) that are cleaned and processed as they arrive.
     
     Returns:
-        list: A list of entities extracted from the text.
+        list: A list of entities extracted from the text, with the 'start_pos' and 'end_pos' of
+            their first mention in the text (in the texts one after the other, for an iterable).
     """
-    clean_abstract = clean_text(sentence_text)
-    
-    # Process the cleaned text with Spacy
+    # Paragraphs seen before take their entities from the cache; the rest go through Spacy
     logging.debug("Predicting NER tags with Spacy...")
-    doc = nlp(clean_abstract)
-    logging.debug("... done!!!")
-    
+    texts = [sentence_text] if isinstance(sentence_text, str) else sentence_text
+
+    def cleaned_paragraphs():
+        offset = 0
+        for text in texts:
+            yield from timed_iter(iter_paragraphs(text, offset=offset), 'clean_text')
+            count('clean_text', 'characters', len(text))
+            offset += len(text)
+
     # Extract entities
     entities = []
     unique_entities = set()
 
-    for entity in doc.ents:
-        text_type_combo = (entity.text, entity.label_)
-        if text_type_combo not in unique_entities:
-            entities.append({
-                'text': entity.text,
-                'type': entity.label_,
-            })
-            unique_entities.add(text_type_combo)
+    with stage('ner'):
+        for paragraph, paragraph_entities in iter_paragraph_entities(cleaned_paragraphs()):
+            for text, label, start, end in paragraph_entities:
+                text_type_combo = (text, label)
+                if text_type_combo not in unique_entities:
+                    start_pos, end_pos = paragraph.source_span(start, end)
+                    entities.append({
+                        'text': text,
+                        'type': label,
+                        'start_pos': start_pos,
+                        'end_pos': end_pos,
+                    })
+                    unique_entities.add(text_type_combo)
+    count('ner', 'entities', len(entities))
+    logging.debug("... done!!!")
 
     return entities
 
-def clean_text(text):
+def ner_cache_key(paragraph):
     """
-    Cleans the given text by keeping only paragraphs and removing all other whitespace or orphaned words.
-
     Args:
-        text (str): The text to clean.
-    
+        paragraph (str): A cleaned paragraph.
+
     Returns:
-        str: The cleaned text with only paragraphs.
+        str: The paragraph's key in the NER cache, which changes with the text and the model.
+    """
+    # 'spans': entries hold [text, label, start, end]
+    return f"{NER_MODEL_ID}:spans:{content_hash(paragraph.encode('utf-8'))}"
+
+def iter_paragraph_entities(paragraphs):
+    """
+    Finds the entities of each paragraph, running Spacy only on paragraphs missing from the NER
+    cache. Misses are fed to nlp.pipe in batches as the paragraphs arrive; a paragraph longer than
+    NER_CHUNK_CHARS is processed in chunks (see iter_text_chunks). New results are cached at the end.
+
+    Args:
+        paragraphs (iterable): The cleaned paragraphs (see text_normalizer.iter_paragraphs), in document order.
+
+    Yields:
+        tuple: (the paragraph, its entities as [text, label, start, end] lists with offsets in
+            paragraph.text), in document order.
     """
-    no_space_text = whitespace_pattern.sub(' ', text)
-    no_multiple_lines_text = newlines_pattern.sub('\n', no_space_text)
-    no_multiple_lines_text_2 = newlines_pattern.sub('\n', no_multiple_lines_text)
-    paragraphs = paragraph_split_pattern.split(no_multiple_lines_text_2)
-    cleaned_paragraphs = [para for para in paragraphs if len(para.split()) > 5]
-    return ' '.join(cleaned_paragraphs)
+    # One slot per paragraph: the chunks still in Spacy and the entities found so far. Only the
+    # slot's index travels with the chunk through nlp.pipe, since with n_process > 1 the
+    # contexts are pickled and a mutable slot would be updated in a copy
+    slots = {}
+    order = deque()
+    new_entries = []
+    paragraph_count = {'paragraphs': 0, 'cached_paragraphs': 0}
+
+    def chunks_to_process():
+        for index, paragraph in enumerate(paragraphs):
+            paragraph_count['paragraphs'] += 1
+            key = ner_cache_key(paragraph.text)
+            found, cached = ner_cache.get(key)
+            order.append(index)
+            if found:
+                paragraph_count['cached_paragraphs'] += 1
+                slots[index] = {'pending': 0, 'paragraph': paragraph, 'entities': cached or []}
+                continue
+            chunks = list(iter_text_chunks([paragraph.text]))
+            slots[index] = {'pending': len(chunks), 'paragraph': paragraph, 'entities': [], 'key': key}
+            chunk_start = 0
+            for chunk in chunks:
+                # Chunks are consecutive pieces of the paragraph
+                chunk_start = paragraph.text.find(chunk, chunk_start)
+                yield chunk, (index, chunk_start)
+                chunk_start += len(chunk)
+
+    for doc, (index, chunk_start) in nlp.pipe(chunks_to_process(), as_tuples=True, batch_size=NER_BATCH_SIZE, n_process=NER_N_PROCESS):
+        slot = slots[index]
+        slot['entities'].extend(
+            [entity.text, entity.label_, chunk_start + entity.start_char, chunk_start + entity.end_char] for entity in doc.ents
+        )
+        slot['pending'] -= 1
+        if slot['pending'] == 0:
+            new_entries.append((slot['key'], slot['entities']))
+        while order and slots[order[0]]['pending'] == 0:
+            slot = slots.pop(order.popleft())
+            yield slot['paragraph'], slot['entities']
+    # Whatever is left was answered by the cache after the last chunk went through Spacy
+    while order:
+        slot = slots.pop(order.popleft())
+        if slot['pending']:
+            raise RuntimeError(f"NER results missing for {slot['pending']} chunks of a paragraph")
+        yield slot['paragraph'], slot['entities']
+    ner_cache.set_many(new_entries)
+    count('ner', 'paragraphs', paragraph_count['paragraphs'])
+    count('ner', 'cached_paragraphs', paragraph_count['cached_paragraphs'])
+
+def iter_text_chunks(paragraphs, max_chars=None):
+    """
+    Packs paragraphs into chunks of at most `max_chars` characters for nlp.pipe.
+
+    Short paragraphs are joined with a space; a paragraph longer than the limit is cut at the
+    last whitespace before it.
+
+    Args:
+        paragraphs (iterable): The cleaned paragraphs.
+        max_chars (int, optional): The chunk size limit. Defaults to NER_CHUNK_CHARS.
+
+    Yields:
+        str: The next chunk of text.
+    """
+    max_chars = max_chars or NER_CHUNK_CHARS
+    pending = []
+    pending_length = 0
+    for para in paragraphs:
+        while len(para) > max_chars:
+            cut = para.rfind(' ', 0, max_chars)
+            if cut <= 0:
+                cut = max_chars
+            if pending:
+                yield ' '.join(pending)
+                pending, pending_length = [], 0
+            yield para[:cut]
+            para = para[cut:].lstrip()
+        if pending and pending_length + 1 + len(para) > max_chars:
+            yield ' '.join(pending)
+            pending, pending_length = [], 0
+        pending.append(para)
+        pending_length += len(para) + (1 if pending_length else 0)
+    if pending:
+        yield ' '.join(pending)
 
 # def perform_ner_with_text(sentence_text):
 #     """
@@ -148,56 +413,228 @@ def clean_text(text):
 #     return entities
 
 
-def query_wikidata(entity_text):
+def lookup_wikidata_candidates(entity_text, language=WIKIDATA_LANGUAGE, limit=WIKIDATA_CANDIDATE_LIMIT):
+    """
+    Finds Wikidata candidates for the given text, answering from the local index or the lookup
+    cache when possible.
+
+    Args:
+        entity_text (str): The text of the entity to search for.
+        language (str): The language to search in.
+        limit (int): The maximum number of candidates.
+
+    Returns:
+        tuple: (candidates, source) where source is 'local', 'cache', 'remote', 'coalesced'
+            when an identical lookup already in flight answered it, or 'failed' when the search
+            failed (throttled, open circuit or network error) and the entity stays unlinked.
+    """
+    if local_wikidata_index is not None:
+        local_matches = local_wikidata_index.lookup(entity_text, limit)
+        if local_matches:
+            return local_matches, 'local'
+
+    cache_key = f"{language}:{limit}:{normalize_lookup_text(entity_text)}"
+    found, cached_response = wikidata_cache.get(cache_key)
+    if found:
+        return (cached_response['search'] if cached_response is not None else []), 'cache'
+
+    def search():
+        wikidata_response = fetch_wikidata_search(entity_text, language, limit)
+        if wikidata_response is None:
+            # Not cached: a failed search says nothing about whether the text has matches
+            return None
+        candidates = wikidata_response.get('search', [])
+        wikidata_cache.set(cache_key, {'search': candidates} if candidates else None)
+        return candidates
+
+    # Concurrent lookups of the same text (from different requests) share one remote call
+    candidates, shared = wikidata_search_flight.do(cache_key, search)
+    if candidates is None:
+        return [], 'failed'
+    return candidates, 'coalesced' if shared else 'remote'
+
+
+def fetch_wikidata_search(entity_text, language=WIKIDATA_LANGUAGE, limit=WIKIDATA_CANDIDATE_LIMIT):
     """
-    Query Wikidata API to find the entity matching the given text.
+    Query Wikidata API to find the entities matching the given text.
 
     Args:
         entity_text (str): The text of the entity to search for.
+        language (str): The language to search in.
+        limit (int): The maximum number of candidates.
 
     Returns:
-        dict: The JSON response from Wikidata API.
+        dict: The JSON response from Wikidata API, or None if the search failed.
     """
     # Base URL for Wikidata API
-    url = "https://www.wikidata.org/w/api.php"
+    url = WIKIDATA_API_URL
 
     # Parameters for the API request
     params = {
         'action': 'wbsearchentities',
         'search': entity_text,
-        'language': 'en',
+        'language': language,
         'format': 'json',
-        'limit': 1  # Get the top match
+        'limit': limit  # Candidates are re-ranked by expected class in perform_nel
     }
 
-    # Implement incrementing rate throttling
-    wait_time = 1  # Start with 1 second
-    max_wait_time = 60  # Maximum wait time of 60 seconds
-    while True:
-        try:
-            response = requests.get(url, params=params)
-            if response.status_code == 200:
-                return response.json()
-            elif response.status_code == 429:
-                logging.warning(f"Received HTTP 429 Too Many Requests. Waiting for {wait_time} seconds.")
-                time.sleep(wait_time)
-                wait_time = min(wait_time * 2, max_wait_time)  # Exponential backoff
-            else:
-                handleExceptionalMessage(f"Received unexpected HTTP status code {response.status_code}")
-        except requests.exceptions.RequestException as e:
-            handleExceptionalMessage(f"An error occurred: {e}")
-            
+    # Rate limits and 429 pauses are shared by all linking workers (see http_client.py)
+    try:
+        response = http_client.get(url, params=params)
+        if response.status_code == 200:
+            return response.json()
+        # Throttled past the retries, or an error: the entity stays unlinked, the document does not fail
+        logging.warning(f"Wikidata search for {entity_text!r} failed with HTTP {response.status_code}, leaving it unlinked")
+    except (requests.exceptions.RequestException, ValueError) as e:
+        logging.warning(f"Wikidata search for {entity_text!r} failed, leaving it unlinked: {e}")
+    return None
 
-def perform_nel(abstract):
+
+def query_wikidata_class_matches(candidate_ids, class_qid):
     """
-    Performs Named Entity Linking (NEL) on the given abstract using Flair and Wikidata.
+    Finds which candidates are instances of the given class (directly or through subclasses),
+    answering from the lookup cache when possible.
+
+    Args:
+        candidate_ids (list): Wikidata IDs of the candidates.
+        class_qid (str): The expected class QID.
+
+    Returns:
+        tuple: (set of matching IDs, number of remote requests made).
+    """
+    matches = set()
+    missing_ids = []
+    for candidate_id in candidate_ids:
+        found, cached = wikidata_class_cache.get(f"{class_qid}:{candidate_id}")
+        if not found:
+            missing_ids.append(candidate_id)
+        elif cached is not None:
+            matches.add(candidate_id)
+
+    remote_requests = 0
+    for batch_start in range(0, len(missing_ids), WIKIDATA_CLASS_BATCH_SIZE):
+        batch = missing_ids[batch_start:batch_start + WIKIDATA_CLASS_BATCH_SIZE]
+        query = (
+            "SELECT DISTINCT ?item WHERE { VALUES ?item { "
+            + " ".join(f"wd:{candidate_id}" for candidate_id in batch)
+            + f" }} ?item wdt:P31/wdt:P279* wd:{class_qid} }}"
+        )
+        remote_requests += 1
+        batch_matches = fetch_wikidata_sparql_items(query)
+        if batch_matches is None:
+            # Leave the batch uncached so a later request can retry it
+            continue
+        for candidate_id in batch:
+            is_match = candidate_id in batch_matches
+            wikidata_class_cache.set(f"{class_qid}:{candidate_id}", {'match': True} if is_match else None)
+            if is_match:
+                matches.add(candidate_id)
+    return matches, remote_requests
+
+
+def fetch_wikidata_sparql_items(query):
+    """
+    Runs a SPARQL query selecting ?item against the Wikidata Query Service.
+
+    Args:
+        query (str): The SPARQL query.
+
+    Returns:
+        set: The QIDs bound to ?item, or None if the query failed.
+    """
+    try:
+        response = http_client.get(
+            WIKIDATA_SPARQL_URL,
+            params={'query': query, 'format': 'json'},
+            headers={'Accept': 'application/sparql-results+json'},
+        )
+        response.raise_for_status()
+        bindings = response.json().get('results', {}).get('bindings', [])
+        return {binding['item']['value'].rsplit('/', 1)[-1] for binding in bindings}
+    except (requests.exceptions.RequestException, ValueError) as e:
+        # Class filtering only improves ranking, so a failure must not fail the whole request
+        logging.warning(f"Wikidata class query failed, keeping search order: {e}")
+        return None
+
+
+def perform_nel(abstract, stats=None):
+    """
+    Performs Named Entity Linking (NEL) on the given abstract using Spacy and Wikidata.
+
+    Entity types that cannot be linked (dates, numbers, amounts) are skipped. For the others a few
+    candidates are fetched and the first one that is an instance of the class expected for the
+    entity type (see ner_type_to_wikidata_qid) wins; otherwise Wikidata's own top match is kept.
 
     Args:
         abstract (str): The abstract text to perform NEL on.
+        stats (dict, optional): Filled in with per-request linking counters.
 
     Returns:
         list: A list of entities with their linked Wikidata IDs.
     """
+    filtered_sorted_entities, linkable_entities = prepare_entities_for_linking(abstract)
+
+    logging.debug(f"Linking {len(linkable_entities)} of {len(filtered_sorted_entities)} entities with up to {NEL_MAX_WORKERS} concurrent lookups...")
+    with stage('linking'):
+        if NEL_MAX_WORKERS <= 1 or len(linkable_entities) <= 1:
+            lookups = [lookup_wikidata_candidates(entity['text']) for entity in linkable_entities]
+        else:
+            # map() yields results in submission order, so lookups line up with linkable_entities
+            lookups = list(get_linking_executor().map(lambda entity: lookup_wikidata_candidates(entity['text']), linkable_entities))
+
+        class_matches, class_requests = find_class_matches(linkable_entities, [candidates for candidates, _ in lookups])
+        for entity, (candidates, _) in zip(linkable_entities, lookups):
+            link_entity(entity, candidates, class_matches)
+    count('linking', 'lookups', len(lookups))
+    count('linking', 'remote_requests', sum(source in ('remote', 'failed') for _, source in lookups) + class_requests)
+
+    if stats is not None:
+        stats.update(summarize_linking(filtered_sorted_entities, linkable_entities, [source for _, source in lookups], class_requests))
+    return filtered_sorted_entities
+
+def iter_nel(abstract, stats=None):
+    """
+    Streaming variant of perform_nel: yields each entity as soon as it is linked, in completion
+    order. Class checks run per entity instead of in one batch, so the first entities are not
+    held back by the slowest lookup.
+
+    Args:
+        abstract (str): The abstract text to perform NEL on.
+        stats (dict, optional): Filled in with per-request linking counters once all entities are linked.
+
+    Yields:
+        dict: Entities with their linked Wikidata IDs.
+    """
+    filtered_sorted_entities, linkable_entities = prepare_entities_for_linking(abstract)
+    for entity in filtered_sorted_entities:
+        if entity['type'] in UNLINKABLE_ENTITY_TYPES:
+            yield entity
+
+    sources = []
+    class_requests = 0
+    if NEL_MAX_WORKERS <= 1:
+        resolved = (resolve_entity(entity) for entity in linkable_entities)
+    else:
+        resolved = (future.result() for future in as_completed([get_linking_executor().submit(resolve_entity, entity) for entity in linkable_entities]))
+    for entity, source, entity_class_requests in timed_iter(resolved, 'linking'):
+        sources.append(source)
+        class_requests += entity_class_requests
+        yield entity
+
+    if stats is not None:
+        stats.update(summarize_linking(filtered_sorted_entities, linkable_entities, sources, class_requests))
+
+def prepare_entities_for_linking(abstract):
+    """
+    Runs NER and drops entities too short to link.
+
+    Args:
+        abstract (str): The text to perform NER on.
+
+    Returns:
+        tuple: (all kept entities, the subset whose type can be linked). Unlinkable entities
+            already have 'wikidata_id' set to None.
+    """
     entities = perform_ner_with_text(abstract)
     for entity in entities:
         if 'start_pos' in entity:
@@ -208,65 +645,406 @@ def perform_nel(abstract):
     # Filter out entities with score less than 0.87 and sort by score in descending order
     # sorted(
         # keep if length after removing pumctuation is greater than 3
-    filtered_sorted_entities = [entity for entity in entities if len(re.sub(r'\s+', ' ', re.sub(r'[^\w\s]', '', entity['text'])).strip()) >= 3]
+    filtered_sorted_entities = [entity for entity in entities if linkable_text_length(entity['text'], 3) >= 3]
     #     key=lambda x: x['score'],
     #     reverse=True
     # )
     # [:100]# Limit to top 100 entities
-    linked_entities = []
-    total_entities = len(filtered_sorted_entities)
-    for index, entity in enumerate(filtered_sorted_entities):
-        # Calculate and print progress
-        progress = (index + 1) / total_entities * 100
-        logging.debug(f"Progress: {progress:.2f}%")
-        entity_text = entity['text']
-        wikidata_response = query_wikidata(entity_text)
-        # logging.debug(f"wikidata_response: {wikidata_response}")
-        if wikidata_response and 'search' in wikidata_response and len(wikidata_response['search']) > 0:
-            top_match = wikidata_response['search'][0]
-            entity['wikidata_id'] = top_match['id']
-            entity['wikidata_label'] = top_match.get('label', '')
-            entity['wikidata_description'] = top_match.get('description', '')
-            linked_entities.append(entity)
-        else:
+    linkable_entities = []
+    for entity in filtered_sorted_entities:
+        if entity['type'] in UNLINKABLE_ENTITY_TYPES:
             entity['wikidata_id'] = None
-            linked_entities.append(entity)
-    return linked_entities
+        else:
+            linkable_entities.append(entity)
+    return filtered_sorted_entities, linkable_entities
+
+def resolve_entity(entity):
+    """
+    Looks up, class-checks and links a single entity.
+
+    Args:
+        entity (dict): The entity with its 'text' and 'type'.
+
+    Returns:
+        tuple: (the linked entity, lookup source, number of class query requests made).
+    """
+    candidates, source = lookup_wikidata_candidates(entity['text'])
+    class_matches, class_requests = find_class_matches([entity], [candidates])
+    return link_entity(entity, candidates, class_matches), source, class_requests
+
+def summarize_linking(filtered_entities, linkable_entities, sources, class_requests):
+    """
+    Args:
+        filtered_entities (list): All entities considered for linking.
+        linkable_entities (list): The entities that were looked up.
+        sources (list): The lookup source ('local', 'cache', 'remote', 'coalesced' or 'failed') of each lookup.
+        class_requests (int): Class query requests made.
+
+    Returns:
+        dict: The per-request linking counters reported in 'linking_stats'.
+    """
+    remote_requests = sources.count('remote') + sources.count('failed') + class_requests
+    return {
+        'entities': len(filtered_entities),
+        'skipped_unlinkable': len(filtered_entities) - len(linkable_entities),
+        'local_hits': sources.count('local'),
+        'cache_hits': sources.count('cache'),
+        'coalesced_lookups': sources.count('coalesced'),
+        'search_requests': sources.count('remote'),
+        'failed_lookups': sources.count('failed'),
+        'class_requests': class_requests,
+        # One wbsearchentities request per entity is what linking used to cost. Class checks can
+        # outnumber the searches avoided; search_requests and class_requests give the actual cost
+        'requests_saved': max(0, len(filtered_entities) - remote_requests),
+    }
+
+def get_linking_executor():
+    """
+    Returns the thread pool used for entity linking, creating it on first use in this process.
+
+    Returns:
+        ThreadPoolExecutor: The linking executor.
+    """
+    global _linking_executor, _linking_executor_pid
+    # Threads do not survive a fork, so each worker process builds its own pool
+    if _linking_executor is None or _linking_executor_pid != os.getpid():
+        _linking_executor = ThreadPoolExecutor(max_workers=NEL_MAX_WORKERS, thread_name_prefix="nel")
+        _linking_executor_pid = os.getpid()
+    return _linking_executor
+
+def find_class_matches(entities, candidate_lists):
+    """
+    Works out which candidates match the class expected for their entity's type.
+
+    A local-index candidate whose direct 'instance_of' (P31) classes include the expected class
+    matches without a request. Every other candidate, local or remote, is checked for P31/P279*
+    membership with one batched query per expected class, so a candidate that is an instance of
+    a subclass (e.g. a university for an organization) is matched whichever backend found it.
+
+    Args:
+        entities (list): The entities being linked.
+        candidate_lists (list): The Wikidata candidates for each entity.
+
+    Returns:
+        tuple: (set of (candidate ID, class QID) pairs that match, number of remote requests made).
+    """
+    class_matches = set()
+    ids_to_check = {}
+    for entity, candidates in zip(entities, candidate_lists):
+        class_qid = ner_type_to_wikidata_qid.get(entity['type'])
+        if class_qid is None or len(candidates) < 2:
+            # Nothing to re-rank
+            continue
+        for candidate in candidates:
+            if class_qid in candidate.get('instance_of', ()):
+                class_matches.add((candidate['id'], class_qid))
+            else:
+                ids_to_check.setdefault(class_qid, set()).add(candidate['id'])
+
+    class_requests = 0
+    for class_qid, candidate_ids in ids_to_check.items():
+        matches, remote_requests = query_wikidata_class_matches(sorted(candidate_ids), class_qid)
+        class_requests += remote_requests
+        class_matches.update((candidate_id, class_qid) for candidate_id in matches)
+    return class_matches, class_requests
+
+def link_entity(entity, candidates, class_matches):
+    """
+    Links a single entity to its best Wikidata candidate.
+
+    Args:
+        entity (dict): The entity with its 'text' and 'type'.
+        candidates (list): The Wikidata candidates in search order.
+        class_matches (set): (candidate ID, class QID) pairs known to match.
+
+    Returns:
+        dict: The same entity with the Wikidata fields filled in.
+    """
+    if not candidates:
+        entity['wikidata_id'] = None
+        return entity
+    class_qid = ner_type_to_wikidata_qid.get(entity['type'])
+    top_match = next(
+        (candidate for candidate in candidates if (candidate['id'], class_qid) in class_matches),
+        candidates[0]
+    )
+    entity['wikidata_id'] = top_match['id']
+    entity['wikidata_label'] = top_match.get('label', '')
+    entity['wikidata_description'] = top_match.get('description', '')
+    return entity
+
+def perform_batch_nel(entity_lists, batch_state=None):
+    """
+    Links the entities of many documents at once. Each distinct normalized surface form is looked
+    up once and each distinct (form, type) pair is class-checked once, and the results are fanned
+    back out to every mention, so linking cost grows with the batch's vocabulary rather than
+    with its number of mentions.
+
+    Args:
+        entity_lists (list): The linkable entities of each document (see prepare_entities_for_linking).
+        batch_state (dict, optional): Lookups already made for earlier documents of the same batch;
+            updated in place, with running counters under 'stats'.
+
+    Returns:
+        list: The same entity lists, linked.
+    """
+    batch_state = batch_state if batch_state is not None else {}
+    form_candidates = batch_state.setdefault('forms', {})
+    class_matches = batch_state.setdefault('class_matches', set())
+    class_checked = batch_state.setdefault('class_checked', set())
+    stats = batch_state.setdefault('stats', {
+        'mentions': 0, 'distinct_forms': 0, 'local_hits': 0, 'cache_hits': 0, 'coalesced_lookups': 0, 'search_requests': 0, 'failed_lookups': 0, 'class_requests': 0,
+    })
+
+    mentions = [(normalize_lookup_text(entity['text']), entity) for entities in entity_lists for entity in entities]
+    new_forms = {}
+    for form, entity in mentions:
+        if form not in form_candidates:
+            new_forms.setdefault(form, entity['text'])
+
+    logging.debug(f"Linking {len(mentions)} mentions with {len(new_forms)} new distinct forms...")
+    if NEL_MAX_WORKERS <= 1 or len(new_forms) <= 1:
+        lookups = [lookup_wikidata_candidates(text) for text in new_forms.values()]
+    else:
+        lookups = list(get_linking_executor().map(lookup_wikidata_candidates, new_forms.values()))
+    failed_forms = []
+    for form, (candidates, source) in zip(new_forms, lookups):
+        form_candidates[form] = candidates
+        if source == 'failed':
+            failed_forms.append(form)
+        stats[{'local': 'local_hits', 'cache': 'cache_hits', 'coalesced': 'coalesced_lookups', 'remote': 'search_requests', 'failed': 'failed_lookups'}[source]] += 1
+
+    # The expected class depends on the entity type, so each (form, type) pair is checked once
+    representatives = {}
+    for form, entity in mentions:
+        if (form, entity['type']) not in class_checked:
+            representatives.setdefault((form, entity['type']), entity)
+    matches, class_requests = find_class_matches(
+        list(representatives.values()), [form_candidates[form] for form, _ in representatives]
+    )
+    class_matches.update(matches)
+    class_checked.update(pair for pair in representatives if pair[0] not in failed_forms)
+
+    for form, entity in mentions:
+        link_entity(entity, form_candidates[form], class_matches)
+    # Failed searches are tried again for the job's later documents
+    for form in failed_forms:
+        del form_candidates[form]
+    count('linking', 'lookups', len(new_forms))
+    stats['mentions'] += len(mentions)
+    stats['distinct_forms'] = len(form_candidates)
+    stats['class_requests'] += class_requests
+    return entity_lists
 
 def extract_graph_nodes_and_links_from_paragraph(paragraph, source_url, is_doi=False):
     logging.debug("Performing NER on the abstract...")
-    linked_entities = perform_nel(paragraph)
-    
+    linking_stats = {}
+    linked_entities = perform_nel(paragraph, linking_stats)
+    with stage('graph_assembly'):
+        return assemble_graph(linked_entities, source_url, is_doi, linking_stats)
+
+def assemble_graph(linked_entities, source_url, is_doi=False, linking_stats=None):
+    """
+    Args:
+        linked_entities (list): The linked entities of a document.
+        source_url (str): The URL (or doi.org URL) of the document.
+        is_doi (bool): Whether the source is a DOI.
+        linking_stats (dict, optional): The linking counters to report.
+
+    Returns:
+        dict: The graph: the entities and the document node, linked by MENTION links.
+    """
+    nodes = []
     links = []
+    node_ids = set()
         
-    base_node = ({
-        'id': str(uuid.uuid4()),
-        'text': source_url,
-        'type': 'DOI' if is_doi else 'URL',
-        # 'score': 1.0,
-        # TODO: fix the statement below to include full paper wikidata info
-        'wikidata_id': None
-    })
+    base_node = make_base_node(source_url, is_doi)
         
     for entity in linked_entities:
-        entity['id'] = str(uuid.uuid4())
-        links.append({
-            'source': base_node['id'],
-            'target': entity['id'],
-            'type': 'MENTION',
-            # 'score': entity['score']
-        })
+        link = make_mention_link(base_node, entity)
+        # Different surface forms linked to the same Wikidata item are one node
+        if entity['id'] not in node_ids:
+            node_ids.add(entity['id'])
+            nodes.append(entity)
+            links.append(link)
         
     # Add a new entity with the source_url
-    linked_entities.append(base_node)
+    nodes.append(base_node)
     
-    return ({"nodes": linked_entities, "links": links})
+    return ({"nodes": nodes, "links": links, "linking_stats": linking_stats or {}})
+
+def make_base_node(source_url, is_doi=False):
+    base_node = {
+        'text': source_url,
+        'type': 'DOI' if is_doi else 'URL',
+        # 'score': 1.0,
+        # TODO: fix the statement below to include full paper wikidata info
+        'wikidata_id': None
+    }
+    return dict(base_node, id=node_id(base_node))
+
+def make_mention_link(base_node, entity):
+    # Node IDs are derived from the Wikidata ID (or the text), so they match across responses and the graph store
+    entity['id'] = node_id(entity)
+    return {
+        'source': base_node['id'],
+        'target': entity['id'],
+        'type': 'MENTION',
+        # 'score': entity['score']
+    }
+
+def iter_graph_records(load_document, source_url, is_doi=False, flight_key=None, include_timing=False):
+    """
+    Streams the graph records of a document (see iter_document_graph_records) while collecting
+    stage timings, which are added to the summary record when `include_timing` is set.
+    """
+    with collect_timings() as timings:
+        for record in iter_document_graph_records(load_document, source_url, is_doi, flight_key):
+            if include_timing and record['kind'] == 'summary':
+                record['timing'] = timings.summary()
+            yield record
+
+def iter_document_graph_records(load_document, source_url, is_doi=False, flight_key=None):
+    """
+    Builds a graph incrementally for a streaming response: the base DOI/URL node first, then
+    each entity node and its MENTION link as soon as the entity is linked, then a summary.
+
+    Args:
+        load_document (callable): Returns the document dict from load_url_document or
+            load_doi_abstract_document.
+        source_url (str): The URL (or doi.org URL) of the document.
+        is_doi (bool): Whether the source is a DOI.
+        flight_key (tuple, optional): The document_flight key; when an identical request is
+            already building the graph, its result is replayed instead of building it again. If
+            that request's client disconnects first, a waiting request takes the build over; one
+            that waits longer than DOCUMENT_FLIGHT_WAIT_SECONDS builds the graph itself.
+
+    Yields:
+        dict: Records with a 'kind' of 'node', 'link', 'summary' or 'error'.
+    """
+    started = time.perf_counter()
+    base_node = make_base_node(source_url, is_doi)
+    yield dict(base_node, kind='node')
+    time_to_first_node = time.perf_counter() - started
+    time_to_first_entity = None
+    nodes, links, linking_stats = [], [], {}
+    node_ids = set()
+    leader, call = True, None
+    graph = error = None
+    try:
+        while flight_key:
+            leader, call = document_flight.begin(flight_key)
+            if leader:
+                break
+            try:
+                shared_graph = document_flight.wait(flight_key, call, DOCUMENT_FLIGHT_WAIT_SECONDS)
+            except CancelledCall:
+                # The leader's client went away; the first waiter back in takes the build over
+                continue
+            except TimeoutError:
+                leader, call = True, None
+                break
+            document = {'cache_status': "coalesced", 'graph': shared_graph, 'text_source': shared_graph.get('text_source')}
+            break
+        if leader:
+            document = load_document()
+        if document['graph'] is not None:
+            # Cached graphs are replayed; their own base node is replaced by the one already sent
+            cached_base_id = document['graph']['links'][0]['source'] if document['graph']['links'] else None
+            for node in document['graph']['nodes']:
+                if node['id'] == cached_base_id or (cached_base_id is None and node['text'] == source_url):
+                    continue
+                link = make_mention_link(base_node, dict(node))
+                if link['target'] in node_ids:
+                    continue
+                node_ids.add(link['target'])
+                if time_to_first_entity is None:
+                    time_to_first_entity = time.perf_counter() - started
+                yield dict(node, id=link['target'], kind='node')
+                yield dict(link, kind='link')
+                nodes.append(node)
+                links.append(link)
+            linking_stats = document['graph'].get('linking_stats', {})
+            graph = document['graph']
+        else:
+            for entity in iter_nel(document['text'], linking_stats):
+                link = make_mention_link(base_node, entity)
+                if link['target'] in node_ids:
+                    continue
+                node_ids.add(link['target'])
+                if time_to_first_entity is None:
+                    time_to_first_entity = time.perf_counter() - started
+                yield dict(entity, kind='node')
+                yield dict(link, kind='link')
+                nodes.append(entity)
+                links.append(link)
+            graph = {"nodes": nodes + [base_node], "links": links, "linking_stats": linking_stats}
+            store_document_graph(document, graph)
+    except Exception as e:
+        error = e
+        yield {'kind': 'error', 'message': str(e)}
+        return
+    finally:
+        if leader and call is not None:
+            if graph is None and error is None:
+                # The response was closed mid-stream (GeneratorExit); waiters take over instead of failing
+                document_flight.cancel(flight_key, call)
+            else:
+                document_flight.finish(flight_key, call, with_document_status(graph, document) if graph is not None else None, error)
+    yield {
+        'kind': 'summary',
+        'nodes': len(nodes) + 1,
+        'links': len(nodes),
+        'linking_stats': linking_stats,
+        'document_cache': document['cache_status'],
+        'text_source': document.get('text_source'),
+        'time_to_first_node_ms': round(time_to_first_node * 1000, 1),
+        'time_to_first_entity_ms': round(time_to_first_entity * 1000, 1) if time_to_first_entity is not None else None,
+        'total_ms': round((time.perf_counter() - started) * 1000, 1),
+    }
+
+def stream_graph_response(records, stream_format):
+    """
+    Wraps graph records in a streaming Flask response.
+
+    Args:
+        records (iterable): Records from iter_graph_records.
+        stream_format (str): 'ndjson' for newline-delimited JSON or 'sse' for server-sent events.
+
+    Returns:
+        Response: The streaming response.
+    """
+    if stream_format == 'sse':
+        body = (f"event: {record['kind']}\ndata: {json.dumps(record)}\n\n" for record in records)
+        mimetype = 'text/event-stream'
+    else:
+        body = (json.dumps(record) + "\n" for record in records)
+        mimetype = 'application/x-ndjson'
+    # Stop proxies (and Cloud Run's front end) from buffering the stream
+    return Response(stream_with_context(body), mimetype=mimetype, headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+def get_stream_option(body):
+    """
+    Args:
+        body (dict): The request JSON.
+
+    Returns:
+        str: 'ndjson', 'sse', or None for a regular JSON response.
+    """
+    stream_format = body.get("stream")
+    if stream_format in (None, False, ""):
+        return None
+    if stream_format is True:
+        return 'ndjson'
+    if stream_format not in ('ndjson', 'sse'):
+        handleExceptionalMessage(f"Unsupported stream format ''{stream_format}''. Use 'ndjson' or 'sse'.")
+    return stream_format
 
 def extract_doi_metadata(item):
-    logging.debug("**** Extracts metadata from a CrossRef API item.", item)
+    logging.debug("**** Extracts metadata from a CrossRef API item.")
     doi = item.get('DOI')
-    title = item.get('title', [''])[0]
-    abstract = item.get('abstract', 'Abstract not available.')
+    title = (item.get('title') or [''])[0]
+    abstract = item.get('abstract', ABSTRACT_NOT_AVAILABLE)
     referenced_by_count = item.get('is-referenced-by-count', 0)
     return {
         "DOI": doi,
@@ -277,13 +1055,22 @@ def extract_doi_metadata(item):
 
 def query_crossref_metadata(doi):
     logging.debug("**** Queries CrossRef API for a specific DOI and retrieves metadata.")
-    url = f"https://api.crossref.org/works/{doi}"
+    found, cached_metadata = crossref_cache.get(doi.lower())
+    if found:
+        if cached_metadata is None:
+            handleExceptionalMessage(f"No CrossRef record for DOI: {doi}")
+        return cached_metadata
+    url = f"{CROSSREF_API_URL}/works/{doi}"
     try:
-        response = requests.get(url)
+        response = http_client.get(url)
+        if response.status_code == 404:
+            crossref_cache.set(doi.lower(), None)
         response.raise_for_status()        
         data = response.json()
         if 'message' in data:
-            return extract_doi_metadata(data['message'])
+            metadata = extract_doi_metadata(data['message'])
+            crossref_cache.set(doi.lower(), metadata)
+            return metadata
         else:
             handleExceptionalMessage(f"No message present in CrossRef response for DOI: {doi}")
     except requests.exceptions.RequestException as e:
@@ -293,6 +1080,8 @@ def query_crossref_metadata(doi):
 def post_extract_doi_text_content():
     logging.debug("**** Attempts to visit the DOI URL and extract the text content from the html or PDF")
     doi = request.json.get("doi", "")
+    full_text = bool(request.json.get("full_text", False))
+    stream_format = get_stream_option(request.json)
     
     if not doi:
         handleExceptionalMessage("Must provide a DOI.")
@@ -300,119 +1089,641 @@ def post_extract_doi_text_content():
     if not doi_compiled_regex.match(doi):
         handleExceptionalMessage(f"Invalid DOI format. ''{doi}''")
     
-    return query_url_text_content(f"https://doi.org/{doi}",True)
+    url = f"https://doi.org/{doi}"
+    pdf_options = get_pdf_options(request.json)
+    main_content = get_main_content_option(request.json)
+
+    def load_document():
+        return load_doi_document(doi, full_text, pdf_options, main_content)
+
+    flight_key = ('doi', doi.lower(), json.dumps([full_text, pdf_options, main_content]))
+    include_timing = get_timing_option(request.json)
+    if stream_format:
+        return stream_graph_response(iter_graph_records(load_document, url, True, flight_key, include_timing), stream_format)
+    return build_document_graph_once(flight_key, load_document, url, True, include_timing)
+
+def load_doi_document(doi, full_text=False, pdf_options=None, main_content=False):
+    """
+    Loads a DOI from its CrossRef abstract, or from the full text at doi.org when asked to
+    or when CrossRef has no abstract.
+
+    Args:
+        doi (str): The DOI.
+        full_text (bool): Skip the CrossRef abstract.
+        pdf_options (dict, optional): 'max_pages' and 'page_range' for PDF documents.
+        main_content (bool): Keep only the main article element of HTML pages.
+
+    Returns:
+        dict: A document (see load_url_document).
+    """
+    document = None if full_text else load_doi_abstract_document(doi)
+    if document is None:
+        document = dict(load_url_document(f"{DOI_RESOLVER_URL}/{doi}", True, pdf_options, main_content), text_source="full_text")
+    return document
+
+def load_doi_abstract_document(doi, metadata=None):
+    """
+    Loads the CrossRef title and abstract of a DOI, or its cached graph.
+
+    Args:
+        doi (str): The DOI.
+        metadata (dict, optional): CrossRef metadata already at hand (see extract_doi_metadata).
+
+    Returns:
+        dict: A document (see load_url_document), or None when CrossRef has no abstract for the DOI.
+    """
+    cache_key = f"crossref:{doi.lower()}"
+    cached = document_cache.get(cache_key)
+    if cached:
+        document_cache.count("immutable_hits")
+        document_cache.touch(cache_key)
+        return {'cache_key': cache_key, 'cache_status': "immutable", 'graph': cached['graph'], 'text_source': "crossref_abstract"}
+
+    try:
+        with stage('fetch'):
+            metadata = metadata or query_crossref_metadata(doi)
+    except Exception as e:
+        logging.warning(f"CrossRef lookup failed for {doi}, falling back to full text: {e}")
+        return None
+    if not metadata or metadata['Abstract'] == ABSTRACT_NOT_AVAILABLE:
+        return None
+
+    # CrossRef abstracts are JATS XML; keep the title in the same paragraph, since iter_paragraphs
+    # drops paragraphs as short as a title on its own
+    with stage('extraction'):
+        abstract = BeautifulSoup(metadata['Abstract'], 'html.parser').get_text(separator=" ")
+    text_content = f"{metadata['Title']}. {abstract}" if metadata['Title'] else abstract
+    count('extraction', 'characters', len(text_content))
+    document_cache.count("misses")
+    return {'cache_key': cache_key, 'cache_status': "miss", 'graph': None, 'text': text_content, 'text_source': "crossref_abstract"}
 
 @app.route('/url2graph', methods=['POST'])
 def post_extract_url_text_content():
     url = request.json.get("url", "")
-    return query_url_text_content(url,False)
+    stream_format = get_stream_option(request.json)
+    pdf_options = get_pdf_options(request.json)
+    main_content = get_main_content_option(request.json)
+    if stream_format:
+        if not url:
+            handleExceptionalMessage("Must provide a URL.")
+        flight_key = ('url', url, json.dumps([pdf_options, main_content]))
+        records = iter_graph_records(lambda: load_url_document(url, False, pdf_options, main_content), url, False, flight_key, get_timing_option(request.json))
+        return stream_graph_response(records, stream_format)
+    return query_url_text_content(url,False,pdf_options,main_content,get_timing_option(request.json))
+
+def get_pdf_options(body):
+    """
+    Reads the optional PDF page limits from a request body.
+
+    Args:
+        body (dict): The request JSON.
+
+    Returns:
+        dict: 'max_pages' and 'page_range' (a 1-based "start-end" string), either may be None.
+    """
+    max_pages = body.get("max_pages")
+    return {
+        'max_pages': int(max_pages) if max_pages else None,
+        'page_range': body.get("page_range"),
+    }
+
+def get_timing_option(body):
+    """
+    Args:
+        body (dict): The request JSON.
+
+    Returns:
+        bool: Whether to add a per-stage 'timing' block to the response.
+    """
+    return bool(body.get("timing", False))
+
+def get_main_content_option(body):
+    """
+    Args:
+        body (dict): The request JSON.
 
-def query_url_text_content(url, is_doi=False):
+    Returns:
+        bool: Whether to keep only the main article element of HTML pages.
+    """
+    return bool(body.get("main_content", HTML_MAIN_CONTENT))
+
+def query_url_text_content(url, is_doi=False, pdf_options=None, main_content=False, include_timing=False):
     logging.debug("**** Extract URL text content.")
+    flight_key = ('doi' if is_doi else 'url', url, json.dumps([pdf_options, main_content]))
+    return build_document_graph_once(flight_key, lambda: load_url_document(url, is_doi, pdf_options, main_content), url, is_doi, include_timing)
+
+def build_document_graph_once(flight_key, load_document, source_url, is_doi=False, include_timing=False):
+    """
+    Loads a document and builds its graph, sharing the work with identical requests already in
+    flight in this process instead of fetching, parsing and linking the document again.
+
+    Args:
+        flight_key (tuple): Identifies the document and the options it is built with.
+        load_document (callable): Returns the document (see load_url_document).
+        source_url (str): The URL (or doi.org URL) of the document.
+        is_doi (bool): Whether the source is a DOI.
+        include_timing (bool): Add a 'timing' block with the time and counts of each stage.
+
+    Returns:
+        dict: The graph (see build_document_graph).
+    """
+    with collect_timings() as timings:
+        graph, shared = document_flight.do(flight_key, lambda: build_document_graph(load_document(), source_url, is_doi), DOCUMENT_FLIGHT_WAIT_SECONDS)
+    if shared:
+        # As in iter_document_graph_records: the leader's cache status is not this request's
+        graph = dict(graph, document_cache="coalesced")
+    if include_timing:
+        graph = dict(graph, timing=timings.summary())
+    return graph
+
+def build_document_graph(document, source_url, is_doi=False):
+    """
+    Returns the cached graph of a document, or builds (and caches) it from the document text.
+
+    Args:
+        document (dict): A document from load_url_document or load_doi_abstract_document.
+        source_url (str): The URL (or doi.org URL) of the document.
+        is_doi (bool): Whether the source is a DOI.
+
+    Returns:
+        dict: The graph, with the document_cache status (and text_source, when known).
+    """
+    if document['graph'] is not None:
+        return with_document_status(document['graph'], document)
+    graph = extract_graph_nodes_and_links_from_paragraph(document['text'], source_url, is_doi)
+    store_document_graph(document, graph)
+    return with_document_status(graph, document)
+
+def with_document_status(graph, document):
+    extra = {'document_cache': document['cache_status']}
+    if document.get('text_source'):
+        extra['text_source'] = document['text_source']
+    return dict(graph, **extra)
+
+def store_document_graph(document, graph):
+    with stage('storage'):
+        document_cache.put(document['cache_key'], graph, document.get('content_hash'), document.get('etag'), document.get('last_modified'))
+        graph_store.add_graph(graph)
+
+def load_url_document(url, is_doi=False, pdf_options=None, main_content=False):
+    """
+    Fetches a URL and extracts its text, unless the document cache can answer instead.
+
+    Args:
+        url (str): The URL to fetch.
+        is_doi (bool): Whether the URL is a doi.org URL (cached graphs are then served without fetching).
+        pdf_options (dict, optional): 'max_pages' and 'page_range' for PDF documents.
+        main_content (bool): Keep only the main article element of HTML pages.
+
+    Returns:
+        dict: 'cache_key', 'cache_status' and either 'graph' (a cached graph) or 'text' (the
+            extracted text, possibly a generator of PDF pages) with the validators to cache it under.
+    """
     if not url:
         handleExceptionalMessage("Must provide a URL.")
+    pdf_options = pdf_options or {}
+
+    # Graphs built from part of a document are cached separately from the whole document
+    cache_key = url
+    if pdf_options.get('max_pages') or pdf_options.get('page_range'):
+        cache_key = f"{url}#max_pages={pdf_options.get('max_pages')}&page_range={pdf_options.get('page_range')}"
+    if main_content:
+        cache_key = f"{cache_key}#main_content"
+
+    # DOIs are immutable, so a cached graph is served without fetching anything
+    cached = document_cache.get(cache_key)
+    if cached and is_doi:
+        document_cache.count("immutable_hits")
+        document_cache.touch(cache_key)
+        return {'cache_key': cache_key, 'cache_status': "immutable", 'graph': cached['graph']}
+
     try:
-        response = requests.get(url)
-        response.raise_for_status()
+        with stage('fetch'):
+            response = http_client.get(url, headers=document_cache.conditional_headers(cached), stream=True)
+            etag = response.headers.get('ETag')
+            last_modified = response.headers.get('Last-Modified')
+            if response.status_code == 304 and cached:
+                document_cache.count("not_modified_hits")
+                document_cache.touch(cache_key, etag, last_modified)
+                return {'cache_key': cache_key, 'cache_status': "not_modified", 'graph': cached['graph']}
+            response.raise_for_status()
+            content = read_capped_content(response, DOCUMENT_MAX_BYTES)
+        count('fetch', 'bytes', len(content))
+
+        # Servers without validators still let us skip NLP when the bytes are identical
+        fetched_hash = content_hash(content)
+        if cached and cached['content_hash'] == fetched_hash:
+            document_cache.count("unchanged_hits")
+            document_cache.touch(cache_key, etag, last_modified)
+            return {'cache_key': cache_key, 'cache_status': "unchanged", 'graph': cached['graph']}
+        document_cache.count("misses")
         
         content_type = response.headers.get('Content-Type', '').lower()
         text_content = ""
         
         if 'application/pdf' in content_type:
-            text_content = extract_text_from_pdf(response.content)
+            # A generator of page texts: NER starts on the first pages while later ones are extracted
+            text_content = extract_text_from_pdf(content, **pdf_options)
         else:
-            soup = BeautifulSoup(response.text, 'html.parser')
-            text_content = soup.get_text(separator="\n").strip()
-        return extract_graph_nodes_and_links_from_paragraph(text_content,url,is_doi)
+            encoding = response.encoding if 'charset=' in content_type else None
+            with stage('extraction'):
+                text_content = extract_text_from_html(content, encoding, main_content)
+            count('extraction', 'characters', len(text_content))
+        return {
+            'cache_key': cache_key,
+            'cache_status': "miss",
+            'graph': None,
+            'text': text_content,
+            'content_hash': fetched_hash,
+            'etag': etag,
+            'last_modified': last_modified,
+        }
     except requests.exceptions.RequestException as e:
         handleExceptionalMessage(f"Error fetching URL ({url}) page content: {e}")
 
-def extract_text_from_pdf(pdf_content):
+def read_capped_content(response, max_bytes):
+    """
+    Reads a streamed response body, refusing documents larger than `max_bytes`.
+
+    Args:
+        response (Response): A response requested with stream=True.
+        max_bytes (int): The size limit.
+
+    Returns:
+        bytes: The body.
+    """
+    declared_length = response.headers.get('Content-Length')
+    if declared_length and declared_length.isdigit() and int(declared_length) > max_bytes:
+        response.close()
+        handleExceptionalMessage(f"Document too large: {declared_length} bytes (limit {max_bytes})")
+    chunks = []
+    received = 0
+    for chunk in response.iter_content(chunk_size=64 * 1024):
+        received += len(chunk)
+        if received > max_bytes:
+            response.close()
+            handleExceptionalMessage(f"Document too large: more than {max_bytes} bytes")
+        chunks.append(chunk)
+    return b''.join(chunks)
+
+def extract_text_from_pdf(pdf_content, max_pages=None, page_range=None):
+    """
+    Extracts the text of a PDF page by page on the extraction process pool.
+
+    Args:
+        pdf_content (bytes): The PDF document.
+        max_pages (int, optional): Extract at most this many pages. Defaults to PDF_MAX_PAGES.
+        page_range (str, optional): A 1-based "start-end" range of pages to extract.
+
+    Yields:
+        str: The text of each page, in order.
+    """
     try:
-        pdf_reader = PdfReader(BytesIO(pdf_content))
-        text = ""
-        for page in pdf_reader.pages:
-            text += page.extract_text() + "\n"
-        return text
+        pages = iter_pdf_pages_text(
+            pdf_content,
+            max_pages=max_pages or PDF_MAX_PAGES,
+            page_range=page_range,
+            workers=PDF_EXTRACTION_WORKERS,
+        )
+        # Pages are extracted while NER runs, so only the time spent waiting for them counts
+        for page_text in timed_iter(pages, 'extraction'):
+            count('extraction', 'characters', len(page_text))
+            count('extraction', 'pages', 1)
+            yield page_text
     except Exception as e:
         handleExceptionalMessage(f"Error extracting text from PDF: {e}")
 
+@app.route('/batch', methods=['POST'])
+def post_batch():
+    """
+    Queues graph building for a list of DOIs and/or URLs and returns the job ID right away.
+    Items are either strings (DOIs are told apart from URLs by their format) or objects with
+    a "doi" or "url" key; full_text, max_pages, page_range and main_content apply to every item.
+    """
+    raw_items = request.json.get("items", [])
+    if not raw_items:
+        handleExceptionalMessage("Must provide a list of DOIs and/or URLs.")
+    if len(raw_items) > BATCH_MAX_ITEMS:
+        handleExceptionalMessage(f"Too many items: {len(raw_items)} (limit {BATCH_MAX_ITEMS})")
+    options = {
+        'full_text': bool(request.json.get("full_text", False)),
+        'pdf_options': get_pdf_options(request.json),
+        'main_content': get_main_content_option(request.json),
+    }
+    items = [dict(parse_batch_item(raw_item), **options) for raw_item in raw_items]
+    job_id = batch_queue.submit(items)
+    return {"job_id": job_id, "status_url": f"/batch/{job_id}", "result_url": f"/batch/{job_id}/result"}, 202
+
+def parse_batch_item(raw_item):
+    """
+    Args:
+        raw_item (str or dict): A DOI, a URL, or {"doi": ...} / {"url": ...}.
+
+    Returns:
+        dict: {"doi": ...} or {"url": ...}.
+    """
+    if isinstance(raw_item, dict):
+        if raw_item.get("doi"):
+            raw_item = raw_item["doi"]
+        elif raw_item.get("url"):
+            return {"url": raw_item["url"]}
+        else:
+            handleExceptionalMessage(f"Batch item needs a DOI or a URL: {raw_item}")
+    if doi_compiled_regex.match(raw_item):
+        return {"doi": raw_item}
+    if not raw_item.startswith(("http://", "https://")):
+        handleExceptionalMessage(f"Batch item is neither a DOI nor a URL: ''{raw_item}''")
+    return {"url": raw_item}
+
+def prepare_batch_item(item):
+    """
+    Loads one batch item and runs NER on it, leaving linking to link_batch_items. Runs on the
+    batch worker pool, sharing the loaded model and the caches with request handlers.
+
+    Args:
+        item (dict): A parsed batch item with the batch options.
+
+    Returns:
+        dict: 'document', 'source_url', 'is_doi' and, unless the graph is cached, the
+            'entities' and 'linkable_entities' found by NER.
+    """
+    with collect_timings():
+        if item.get("doi"):
+            document = load_doi_document(item["doi"], item['full_text'], item['pdf_options'], item['main_content'])
+            prepared = {'document': document, 'source_url': f"https://doi.org/{item['doi']}", 'is_doi': True}
+        else:
+            document = load_url_document(item["url"], False, item['pdf_options'], item['main_content'])
+            prepared = {'document': document, 'source_url': item["url"], 'is_doi': False}
+        if document['graph'] is None:
+            prepared['entities'], prepared['linkable_entities'] = prepare_entities_for_linking(document['text'])
+    return prepared
+
+def link_batch_items(prepared_items, batch_state):
+    """
+    Links the entities of prepared batch items together (see perform_batch_nel) and builds and
+    caches their graphs.
+
+    Args:
+        prepared_items (list): Items returned by prepare_batch_item.
+        batch_state (dict): The batch's linking state, kept across calls for the same job.
+
+    Returns:
+        list: The graph of each item.
+    """
+    to_link = [prepared for prepared in prepared_items if prepared['document']['graph'] is None]
+    graphs = []
+    with collect_timings():
+        with stage('linking'):
+            perform_batch_nel([prepared['linkable_entities'] for prepared in to_link], batch_state)
+        for prepared in prepared_items:
+            document = prepared['document']
+            if document['graph'] is None:
+                linking_stats = {
+                    'entities': len(prepared['entities']),
+                    'skipped_unlinkable': len(prepared['entities']) - len(prepared['linkable_entities']),
+                    'linked_in_batch': len(prepared['linkable_entities']),
+                }
+                with stage('graph_assembly'):
+                    graph = assemble_graph(prepared['entities'], prepared['source_url'], prepared['is_doi'], linking_stats)
+                store_document_graph(document, graph)
+            else:
+                graph = document['graph']
+            graphs.append(with_document_status(graph, document))
+    return graphs
+
+batch_queue = BatchJobQueue(BATCH_JOBS_PATH, BATCH_WORKERS, prepare_batch_item, link_batch_items, BATCH_LINK_GROUP_SIZE)
+
+@app.route('/batch/<job_id>', methods=['GET'])
+def get_batch_status(job_id):
+    # Partial graphs of finished items are included with ?results=true
+    status = batch_queue.status(job_id) if batch_job_id_pattern.match(job_id) else None
+    if status is None:
+        return {"error": f"Unknown batch job: {job_id}"}, 404
+    if request.args.get("results", "false").lower() == "true":
+        status["results"] = {str(index): graph for index, graph in batch_queue.iter_item_results(job_id, status)}
+    return status
+
+@app.route('/batch/<job_id>/result', methods=['GET'])
+def get_batch_result(job_id):
+    status = batch_queue.status(job_id) if batch_job_id_pattern.match(job_id) else None
+    if status is None:
+        return {"error": f"Unknown batch job: {job_id}"}, 404
+    if status["status"] != "done":
+        return {"error": f"Batch job {job_id} is still {status['status']}", "completed": status["completed"], "failed": status["failed"], "total": status["total"]}, 409
+    return batch_queue.result(job_id)
+
+@app.route('/graph/nodes/<reference>', methods=['GET'])
+def get_graph_node(reference):
+    # The reference is a node ID or a Wikidata ID
+    node = graph_store.get_node(graph_store.resolve(reference))
+    if node is None:
+        return {"error": f"Unknown node: {reference}"}, 404
+    return node
+
+def get_graph_limit(args):
+    """
+    Args:
+        args (MultiDict): The query string.
+
+    Returns:
+        int: The ?limit to use, clamped to GRAPH_QUERY_MAX_LIMIT, or None if it is not a
+            positive integer.
+    """
+    try:
+        limit = int(args.get("limit", GRAPH_QUERY_DEFAULT_LIMIT))
+    except ValueError:
+        return None
+    return min(limit, GRAPH_QUERY_MAX_LIMIT) if limit > 0 else None
+
+@app.route('/graph/nodes/<reference>/neighbors', methods=['GET'])
+def get_graph_neighbors(reference):
+    limit = get_graph_limit(request.args)
+    if limit is None:
+        return {"error": f"Invalid limit: {request.args.get('limit')} (must be a positive integer)"}, 400
+    resolved_id = graph_store.resolve(reference)
+    if resolved_id is None:
+        return {"error": f"Unknown node: {reference}"}, 404
+    return {"node": graph_store.get_node(resolved_id), "neighbors": graph_store.neighbors(resolved_id, limit)}
+
+@app.route('/graph/documents', methods=['GET'])
+def get_graph_documents():
+    # Documents mentioning every entity in ?entities=Q1,Q2 (node IDs or Wikidata IDs)
+    references = [reference for reference in request.args.get("entities", "").split(",") if reference]
+    if not references:
+        handleExceptionalMessage("Must provide at least one entity.")
+    limit = get_graph_limit(request.args)
+    if limit is None:
+        return {"error": f"Invalid limit: {request.args.get('limit')} (must be a positive integer)"}, 400
+    resolved_ids = [graph_store.resolve(reference) for reference in references]
+    if None in resolved_ids:
+        return {"entities": references, "documents": []}
+    return {"entities": references, "documents": graph_store.documents(resolved_ids, limit)}
+
+@app.route('/graph/stats', methods=['GET'])
+def get_graph_stats():
+    return graph_store.stats()
+
+@app.route('/cache_stats', methods=['GET'])
+def get_cache_stats():
+    return {
+        "wikidata": wikidata_cache.stats(),
+        "wikidata_class": wikidata_class_cache.stats(),
+        "crossref": crossref_cache.stats(),
+        "ner": ner_cache.stats(),
+        "documents": document_cache.stats(),
+        "http": http_client.stats(),
+        "coalescing": {
+            "documents": document_flight.stats(),
+            "wikidata_search": wikidata_search_flight.stats(),
+        },
+    }
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    # Prometheus text format, summed over every worker process (see METRICS_PATH)
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_duration(response):
+    # For streamed responses this is the time to the first byte
+    started = getattr(g, 'request_started', None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        REQUEST_SECONDS.observe(time.perf_counter() - started, route=route)
+    return response
+
+@app.route('/memory', methods=['GET'])
+def get_memory():
+    # Shared vs private pages of the worker that served this request
+    return {"pid": os.getpid(), "memory_mb": process_memory_mb()}
+
 def handleExceptionalMessage(message):
     logging.exception(message)
     traceback.print_stack()
     raise Exception(message)
 
 
-# @app.route('/get_dois_and_citation_counts_by_keyword', methods=['POST'])
-# def query_crossref_dois_and_citation_counts_by_keyword():
-#     logging.debug("**** Queries CrossRef API by keyword and retrieves all related DOIs and their citation counts with retries.")
-#     max_retries=5
-#     initial_delay=0.5
-#     keyword = request.json.get("keyword", "")
-#     url = "https://api.crossref.org/works"
-#     results = []
-#     cursor = "*"
-#     rows_per_page = 20  # Number of rows to retrieve per request
-    
-#     total_results = 0
-#     retry_count = 0
-#     delay = initial_delay  # Initial delay in seconds
-
-#     while retry_count < max_retries:
-#         try:
-#             # First request to determine total results or continue paginating
-#             params = {
-#                 "query": keyword,
-#                 "rows": rows_per_page,
-#                 "cursor": cursor
-#             }
-
-#             response = requests.get(url, params=params)
-            
-#             # Handle HTTP status 429 (Too Many Requests) or other recoverable errors
-#             if response.status_code == 429:
-#                 raise requests.exceptions.HTTPError("Too Many Requests (429)")
-#             response.raise_for_status()  # Check for request errors
-            
-#             data = response.json()
-            
-#             if total_results == 0:
-#                 # First call, set total_results
-#                 total_results = data.get("message", {}).get("total-results", 0)
-#                 print(f"Total number of results for '{keyword}': {total_results}")
-
-#             # Add the page of results
-#             if 'message' in data and 'items' in data['message']:
-                
-#                 results.extend([extract_doi_metadata(item) for item in data['message']['items']])
-
-#             # Update cursor for pagination
-#             cursor = data.get("message", {}).get("next-cursor")
-#             if not cursor or len(results) >= total_results:
-#                 break  # Exit if no more pages or enough results fetched
-
-#             # Reset retry count after a successful request
-#             retry_count = 0
-#             delay = initial_delay
-
-#             # Respect rate limits (sleep between requests)
-#             time.sleep(delay)
-        
-#         except requests.exceptions.RequestException as e:
-#             print(f"Error occurred: {e}, retrying in {delay} seconds...")
-            
-#             # Increment retry count and apply exponential backoff
-#             retry_count += 1
-#             if retry_count >= max_retries:
-#                 print(f"Max retries reached. Exiting after {retry_count} attempts.")
-#                 break
-
-#             # Wait for the delay period (exponential backoff)
-#             time.sleep(delay)
-#             delay *= 2  # Exponentially increase delay after each retry
-    
-#     return results
+@app.route('/get_dois_and_citation_counts_by_keyword', methods=['POST'])
+def query_crossref_dois_and_citation_counts_by_keyword():
+    """
+    Streamed responses ('stream': 'ndjson' or 'sse') hold one work at a time and return up to
+    'max_results' works. The plain JSON list is built in memory, so it holds at most
+    CROSSREF_LIST_MAX_RESULTS works (default 1000) whatever 'max_results' asks for.
+    """
+    logging.debug("**** Queries CrossRef API by keyword and retrieves all related DOIs and their citation counts.")
+    keyword = request.json.get("keyword", "")
+    if not keyword:
+        handleExceptionalMessage("Must provide a keyword.")
+    stream_format = get_stream_option(request.json)
+    harvest_options = get_harvest_options(request.json)
+    if not stream_format:
+        harvest_options['max_results'] = min(harvest_options['max_results'] or CROSSREF_LIST_MAX_RESULTS, CROSSREF_LIST_MAX_RESULTS)
+    works = iter_crossref_works(keyword, **harvest_options)
+    if stream_format:
+        records = (dict(extract_doi_metadata(work), kind='work') for work, _ in works)
+        return stream_graph_response(records, stream_format)
+    return [extract_doi_metadata(work) for work, _ in works]
+
+@app.route('/keyword2graph', methods=['POST'])
+def post_keyword_to_graph():
+    """
+    Harvests the CrossRef works matching a keyword and streams one graph per work. Pages are
+    prefetched in the background and at most CROSSREF_HARVEST_WORKERS works are processed at a
+    time, so memory stays flat however many works match.
+    """
+    keyword = request.json.get("keyword", "")
+    if not keyword:
+        handleExceptionalMessage("Must provide a keyword.")
+    harvest_options = get_harvest_options(request.json)
+    full_text = bool(request.json.get("full_text", False))
+    pdf_options = get_pdf_options(request.json)
+    main_content = get_main_content_option(request.json)
+
+    def build_work_graph(work):
+        metadata = extract_doi_metadata(work)
+        crossref_cache.set(metadata['DOI'].lower(), metadata)
+        with collect_timings():
+            document = load_doi_abstract_document(metadata['DOI'], metadata)
+            if document is None:
+                if not full_text:
+                    return None
+                document = load_doi_document(metadata['DOI'], True, pdf_options, main_content)
+            return build_document_graph(document, f"https://doi.org/{metadata['DOI']}", True)
+
+    stream_format = get_stream_option(request.json) or 'ndjson'
+    return stream_graph_response(iter_keyword_graph_records(keyword, harvest_options, build_work_graph), stream_format)
+
+def iter_keyword_graph_records(keyword, harvest_options, build_work_graph):
+    """
+    Args:
+        keyword (str): The CrossRef query.
+        harvest_options (dict): Options for iter_crossref_works.
+        build_work_graph (callable): Builds the graph of a CrossRef work, or returns None to skip it.
+
+    Yields:
+        dict: A 'document' record per work (with its graph, or 'skipped' when it has no abstract),
+            'error' records for works that failed, and a final 'summary'.
+    """
+    started = time.perf_counter()
+    counts = {'documents': 0, 'skipped': 0, 'errors': 0}
+    total_results = 0
+    try:
+        works = iter_crossref_works(keyword, **harvest_options)
+        for (work, total_results), future in bounded_map(lambda entry: build_work_graph(entry[0]), works, get_harvest_executor(), CROSSREF_HARVEST_WORKERS * 2):
+            record = {'doi': work.get('DOI'), 'title': (work.get('title') or [''])[0], 'referenced_by_count': work.get('is-referenced-by-count', 0)}
+            if future.exception() is not None:
+                counts['errors'] += 1
+                yield dict(record, kind='error', message=str(future.exception()))
+            elif future.result() is None:
+                counts['skipped'] += 1
+                yield dict(record, kind='document', skipped="no abstract")
+            else:
+                counts['documents'] += 1
+                yield dict(record, kind='document', graph=future.result())
+    except Exception as e:
+        yield {'kind': 'error', 'message': f"CrossRef harvest failed: {e}"}
+    yield dict(counts, kind='summary', keyword=keyword, total_results=total_results, total_ms=round((time.perf_counter() - started) * 1000, 1))
+
+def get_harvest_options(body):
+    """
+    Args:
+        body (dict): The request JSON.
+
+    Returns:
+        dict: Options for iter_crossref_works: page size ('rows', at most 1000) and 'max_results'.
+    """
+    return {
+        'rows': int(body.get("rows", CROSSREF_HARVEST_ROWS)),
+        'max_results': int(body.get("max_results", CROSSREF_HARVEST_MAX_RESULTS)) or None,
+        'prefetch_pages': CROSSREF_HARVEST_PREFETCH_PAGES,
+        'get': http_client.get,
+        # http_client retries throttled pages itself; a second retry loop would multiply them
+        'max_retries': 1,
+        'mailto': CROSSREF_MAILTO,
+        'works_url': f"{CROSSREF_API_URL}/works",
+    }
+
+def get_harvest_executor():
+    """
+    Returns the thread pool that builds keyword harvest graphs, creating it on first use in this process.
+
+    Returns:
+        ThreadPoolExecutor: The harvest executor.
+    """
+    global _harvest_executor, _harvest_executor_pid
+    if _harvest_executor is None or _harvest_executor_pid != os.getpid():
+        _harvest_executor = ThreadPoolExecutor(max_workers=CROSSREF_HARVEST_WORKERS, thread_name_prefix="harvest")
+        _harvest_executor_pid = os.getpid()
+    return _harvest_executor
 
 # Main entry point
 if __name__ == '__main__':
+    # Fork the PDF extraction processes before the development server starts its threads
+    start_pdf_executor(PDF_EXTRACTION_WORKERS)
+    batch_queue.recover()
+    REGISTRY.reset_store()
     app.run(host='0.0.0.0', port=8080)
@@ -0,0 +1,359 @@
+import fcntl
+import glob
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+
+def write_json_atomically(path, data):
+    """
+    Writes JSON so readers in other processes never see a half-written file.
+
+    Args:
+        path (str): The destination file.
+        data: Any JSON-serializable value.
+    """
+    tmp_path = f"{path}.tmp.{os.getpid()}.{threading.get_ident()}"
+    with open(tmp_path, "w") as tmp_file:
+        json.dump(data, tmp_file)
+    os.replace(tmp_path, path)
+
+
+def merge_graphs(graphs):
+    """
+    Merges per-document graphs, collapsing entity nodes that link to the same Wikidata item
+    (or, when unlinked, share text and type) into one node.
+
+    Args:
+        graphs (list): Graphs with 'nodes' and 'links'.
+
+    Returns:
+        dict: The merged graph.
+    """
+    nodes = []
+    links = []
+    node_ids = {}
+    canonical_ids = {}
+    for graph in graphs:
+        for node in graph['nodes']:
+            if node['type'] in ('DOI', 'URL'):
+                key = (node['type'], node['text'])
+            elif node.get('wikidata_id'):
+                key = ('wikidata', node['wikidata_id'])
+            else:
+                key = ('text', node['text'], node['type'])
+            if key not in node_ids:
+                node_ids[key] = node['id']
+                nodes.append(node)
+            canonical_ids[node['id']] = node_ids[key]
+        for link in graph['links']:
+            links.append(dict(link, source=canonical_ids.get(link['source'], link['source']), target=canonical_ids.get(link['target'], link['target'])))
+    return {"nodes": nodes, "links": links}
+
+
+class BatchJobQueue:
+    """
+    In-process job queue for graph batches. Job state lives in files under `jobs_dir`, so any
+    server worker can answer progress polls.
+
+    Each job walks its items in groups of `group_size`: the items of a group are prepared (fetched
+    and run through NER) in parallel on a thread pool that shares the loaded model and caches,
+    then the whole group is handed to `link_items` at once, so that entities shared between
+    documents are linked once. `link_items` receives a state dict that lives for the whole job;
+    whatever it keeps under 'stats' is reported in the job status.
+
+    Layout per job: <job_id>.json (job-level status), <job_id>/items.json (the items, written
+    once), <job_id>/progress.jsonl (one line per item state change, appended), <job_id>/<n>.json
+    (the graph of item n, once done) and <job_id>/result.json (the merged graph, once the job
+    finishes). The process running a job holds an flock on <job_id>/owner.lock; jobs left
+    queued or running without a live owner are resumed by recover().
+    """
+
+    def __init__(self, jobs_dir, workers, prepare_item, link_items, group_size=50, concurrent_jobs=2):
+        self.jobs_dir = jobs_dir
+        self.workers = workers
+        self.prepare_item = prepare_item
+        self.link_items = link_items
+        self.group_size = group_size
+        self.concurrent_jobs = concurrent_jobs
+        self._executors = None
+        self._executors_pid = None
+        self._executors_lock = threading.Lock()
+        self._locks = {}
+        self._owner_files = {}
+        self._locks_lock = threading.Lock()
+        os.makedirs(self.jobs_dir, exist_ok=True)
+
+    def _get_executors(self):
+        # Threads do not survive a fork, so each server worker builds its own pools. Jobs and
+        # items get separate pools, since a job blocks while waiting on its items.
+        with self._executors_lock:
+            if self._executors is None or self._executors_pid != os.getpid():
+                self._executors = (
+                    ThreadPoolExecutor(max_workers=self.concurrent_jobs, thread_name_prefix="batch-job"),
+                    ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="batch"),
+                )
+                self._executors_pid = os.getpid()
+            return self._executors
+
+    def _job_lock(self, job_id):
+        with self._locks_lock:
+            return self._locks.setdefault(job_id, threading.Lock())
+
+    def _status_path(self, job_id):
+        return os.path.join(self.jobs_dir, f"{job_id}.json")
+
+    def _job_dir(self, job_id):
+        return os.path.join(self.jobs_dir, job_id)
+
+    def _progress_path(self, job_id):
+        return os.path.join(self._job_dir(job_id), "progress.jsonl")
+
+    def _claim(self, job_id):
+        """
+        Takes ownership of a job: an flock that the OS releases if this process dies, which is
+        how recover() tells abandoned jobs from running ones.
+
+        Returns:
+            bool: Whether the job was claimed (False if another live process owns it).
+        """
+        owner_file = open(os.path.join(self._job_dir(job_id), "owner.lock"), "a")
+        try:
+            fcntl.flock(owner_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            owner_file.close()
+            return False
+        with self._locks_lock:
+            self._owner_files[job_id] = owner_file
+        return True
+
+    def _release(self, job_id):
+        with self._locks_lock:
+            self._locks.pop(job_id, None)
+            owner_file = self._owner_files.pop(job_id, None)
+        if owner_file is not None:
+            owner_file.close()
+
+    def submit(self, items):
+        """
+        Queues a batch and returns immediately.
+
+        Args:
+            items (list): The batch items, as accepted by prepare_item.
+
+        Returns:
+            str: The job ID.
+        """
+        job_id = uuid.uuid4().hex
+        os.makedirs(self._job_dir(job_id))
+        self._claim(job_id)
+        write_json_atomically(os.path.join(self._job_dir(job_id), "items.json"), items)
+        status = {
+            "id": job_id,
+            "status": "queued",
+            "created_at": time.time(),
+            "finished_at": None,
+            "total": len(items),
+            "linking_stats": {},
+        }
+        write_json_atomically(self._status_path(job_id), status)
+        job_executor, _ = self._get_executors()
+        job_executor.submit(self._run_job, job_id, items)
+        logging.info(f"Queued batch job {job_id} with {len(items)} items")
+        return job_id
+
+    def recover(self):
+        """
+        Resumes the jobs left queued or running by a process that is gone (a restart or a crashed
+        worker). Items already done or failed keep their results; the others are run again. Safe
+        to call from every server worker: each abandoned job is claimed by one of them.
+
+        Returns:
+            int: The number of jobs resumed.
+        """
+        resumed = 0
+        for status_path in glob.glob(os.path.join(self.jobs_dir, "*.json")):
+            job_id = os.path.basename(status_path)[:-len(".json")]
+            status = self.status(job_id)
+            if status is None or status["status"] not in ("queued", "running"):
+                continue
+            if not os.path.isdir(self._job_dir(job_id)) or not self._claim(job_id):
+                continue
+            # Re-read now that the job is ours: its owner may have finished it meanwhile
+            status = self.status(job_id)
+            if status["status"] not in ("queued", "running"):
+                self._release(job_id)
+                continue
+            self._drop_partial_progress(job_id)
+            items = [entry["item"] for entry in status["items"]]
+            pending = [index for index, entry in enumerate(status["items"]) if entry["status"] not in ("done", "failed")]
+            self._append_progress(job_id, [{"index": index, "status": "queued", "error": None} for index in pending])
+            job_executor, _ = self._get_executors()
+            job_executor.submit(self._run_job, job_id, items, pending)
+            logging.info(f"Resumed batch job {job_id}: {len(pending)} of {len(items)} items left")
+            resumed += 1
+        return resumed
+
+    def _update(self, job_id, update):
+        # Job-level fields only; per-item progress goes through _append_progress
+        with self._job_lock(job_id):
+            status = self._read_status(job_id)
+            update(status)
+            write_json_atomically(self._status_path(job_id), status)
+            return status
+
+    def _append_progress(self, job_id, entries):
+        # One small append per state change, instead of rewriting every item's state each time
+        lines = "".join(json.dumps(entry) + "\n" for entry in entries)
+        with self._job_lock(job_id), open(self._progress_path(job_id), "a") as progress_file:
+            progress_file.write(lines)
+
+    def _drop_partial_progress(self, job_id):
+        # A dead owner can leave half a line at the end of the log; later appends would extend it
+        try:
+            with open(self._progress_path(job_id), "rb+") as progress_file:
+                data = progress_file.read()
+                progress_file.truncate(data.rfind(b"\n") + 1)
+        except FileNotFoundError:
+            pass
+
+    def _set_item(self, job_id, index, item_status, error=None):
+        self._append_progress(job_id, [{"index": index, "status": item_status, "error": error}])
+
+    def _run_job(self, job_id, items, indices=None):
+        def mark_running(status):
+            status["status"] = "running"
+        self._update(job_id, mark_running)
+
+        indices = list(range(len(items))) if indices is None else indices
+        state = {}
+        try:
+            for start in range(0, len(indices), self.group_size):
+                self._run_group(job_id, indices[start:start + self.group_size], items, state)
+        except Exception as e:
+            logging.exception(f"Batch job {job_id} failed: {e}")
+        self._finish(job_id)
+
+    def _run_group(self, job_id, indices, items, state):
+        _, item_executor = self._get_executors()
+        futures = {index: item_executor.submit(self._prepare, job_id, index, items[index]) for index in indices}
+        prepared = {index: future.result() for index, future in futures.items()}
+        ready = [index for index in indices if prepared[index] is not None]
+        if not ready:
+            return
+
+        try:
+            graphs = self.link_items([prepared[index] for index in ready], state)
+            errors = {}
+            for index, graph in zip(ready, graphs):
+                write_json_atomically(os.path.join(self._job_dir(job_id), f"{index}.json"), graph)
+        except Exception as e:
+            logging.warning(f"Batch job {job_id} could not link items {ready[0]}-{ready[-1]}: {e}")
+            errors = {index: str(e) for index in ready}
+
+        self._append_progress(job_id, [
+            {"index": index, "status": "failed" if index in errors else "done", "error": errors.get(index)}
+            for index in ready
+        ])
+
+        def mark_linked(status):
+            status["linking_stats"] = state.get("stats", {})
+        self._update(job_id, mark_linked)
+
+    def _prepare(self, job_id, index, item):
+        self._set_item(job_id, index, "running")
+        try:
+            prepared = self.prepare_item(item)
+        except Exception as e:
+            logging.warning(f"Batch job {job_id} item {index} ({item}) failed: {e}")
+            self._set_item(job_id, index, "failed", str(e))
+            return None
+        self._set_item(job_id, index, "extracted")
+        return prepared
+
+    def _finish(self, job_id):
+        status = self.status(job_id)
+        graphs = [graph for _, graph in self.iter_item_results(job_id, status)]
+        write_json_atomically(os.path.join(self._job_dir(job_id), "result.json"), merge_graphs(graphs))
+
+        def mark_finished(status):
+            status["status"] = "done"
+            status["finished_at"] = time.time()
+        self._update(job_id, mark_finished)
+        self._release(job_id)
+        logging.info(f"Batch job {job_id} finished: {status['completed']} done, {status['failed']} failed")
+
+    def _read_status(self, job_id):
+        try:
+            with open(self._status_path(job_id)) as status_file:
+                return json.load(status_file)
+        except FileNotFoundError:
+            return None
+
+    def status(self, job_id):
+        """
+        Args:
+            job_id (str): The job ID.
+
+        Returns:
+            dict: The job status with per-item progress, or None for an unknown job.
+        """
+        status = self._read_status(job_id)
+        if status is None:
+            return None
+        with open(os.path.join(self._job_dir(job_id), "items.json")) as items_file:
+            entries = [{"item": item, "status": "queued", "error": None} for item in json.load(items_file)]
+        extracted = set()
+        try:
+            with open(self._progress_path(job_id)) as progress_file:
+                for line in progress_file:
+                    try:
+                        change = json.loads(line)
+                    except ValueError:
+                        # A line still being appended
+                        break
+                    entries[change["index"]] = dict(entries[change["index"]], status=change["status"], error=change["error"])
+                    if change["status"] == "extracted":
+                        extracted.add(change["index"])
+        except FileNotFoundError:
+            pass
+        status["extracted"] = len(extracted)
+        status["completed"] = sum(1 for entry in entries if entry["status"] == "done")
+        status["failed"] = sum(1 for entry in entries if entry["status"] == "failed")
+        status["items"] = entries
+        return status
+
+    def iter_item_results(self, job_id, status=None):
+        """
+        Yields the graphs of the items finished so far.
+
+        Args:
+            job_id (str): The job ID.
+            status (dict, optional): An already loaded status.
+
+        Yields:
+            tuple: (item index, graph).
+        """
+        status = status or self.status(job_id)
+        for index, item in enumerate(status["items"]):
+            if item["status"] == "done":
+                with open(os.path.join(self._job_dir(job_id), f"{index}.json")) as result_file:
+                    yield index, json.load(result_file)
+
+    def result(self, job_id):
+        """
+        Args:
+            job_id (str): The job ID.
+
+        Returns:
+            dict: The merged graph, or None until the job has finished.
+        """
+        try:
+            with open(os.path.join(self._job_dir(job_id), "result.json")) as result_file:
+                return json.load(result_file)
+        except FileNotFoundError:
+            return None
@@ -0,0 +1,205 @@
+"""
+Runs the real /doi2graph and /url2graph code paths offline: the app is imported with its
+Wikidata, CrossRef and doi.org base URLs pointed at bench/stub_server.py, which serves the
+recorded pages in fixtures/ and answers searches deterministically. Three phases:
+
+    cold    every case once, one at a time, on empty caches
+    load    distinct copies of the recorded pages through /url2graph at --concurrency
+            (new documents, entity lookups increasingly cached)
+    cached  the DOI cases again at --concurrency (served from the document cache)
+
+For each phase it reports requests/sec, latency percentiles, time per pipeline stage (from the
+responses' timing blocks), outbound requests by stub endpoint and peak RSS.
+
+    python bench/bench_end_to_end.py [--concurrency 4] [--repeat 5] [--latency-ms 50]
+        [--stub-rate 50] [--throttle-ratio 0.02] [--save-baseline before.json] [--baseline before.json]
+
+Save a baseline before a change and compare against it after; the model load is not timed.
+"""
+import argparse
+import json
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from stub_server import start_stub_server  # noqa: E402
+
+DOI_CASES = [
+    ("doi_abstract", {"doi": "10.5555/bench.covid"}),
+    ("doi_abstract_only", {"doi": "10.5555/bench.einstein"}),
+    ("doi_full_text_html", {"doi": "10.5555/bench.covid", "full_text": True}),
+    ("doi_full_text_pdf", {"doi": "10.5555/bench.vaccine", "full_text": True}),
+    ("doi_without_abstract", {"doi": "10.5555/bench.news"}),
+]
+PAGES = ["html/publisher_article.html", "html/news_page.html", "pdf/vaccine_uptake.pdf"]
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))] if ordered else 0.0
+
+
+def configure_app_environment(base_url, data_dir, client_rate):
+    os.environ.update({
+        "DATA_DIR": data_dir,
+        "WIKIDATA_API_URL": f"{base_url}/w/api.php",
+        "WIKIDATA_SPARQL_URL": f"{base_url}/sparql",
+        "CROSSREF_API_URL": base_url,
+        "DOI_RESOLVER_URL": f"{base_url}/doi",
+        "HTTP_RATE_LIMITS": "",
+        "HTTP_DEFAULT_RATE_LIMIT": f"{client_rate}:{client_rate}",
+        "LINKING_BACKEND": "remote",
+        "LOG_LEVEL": os.environ.get("LOG_LEVEL", "WARNING"),
+    })
+
+
+def run_phase(app, cases, concurrency, base_url):
+    """
+    Posts every (name, route, body) case through the Flask test client.
+
+    Returns:
+        dict: Throughput, latencies, stage totals, outbound requests and peak RSS of the phase.
+    """
+    local = threading.local()
+    stub_before = requests.get(f"{base_url}/_stats").json()
+    http_before = app.http_client.stats()
+
+    def post(case):
+        name, route, body = case
+        client = getattr(local, "client", None)
+        if client is None:
+            client = local.client = app.app.test_client()
+        started = time.perf_counter()
+        response = client.post(route, json=dict(body, timing=True))
+        elapsed = time.perf_counter() - started
+        graph = response.get_json(silent=True) or {}
+        return name, response.status_code, elapsed, graph.get("timing", {}).get("stages", {})
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        outcomes = list(executor.map(post, cases))
+    wall = time.perf_counter() - started
+
+    stub_after = requests.get(f"{base_url}/_stats").json()
+    http_after = app.http_client.stats()
+    stages = {}
+    for _, _, _, timing in outcomes:
+        for stage_name, values in timing.items():
+            stages[stage_name] = round(stages.get(stage_name, 0.0) + values.get("ms", 0.0), 1)
+    latencies = [elapsed * 1000 for _, _, elapsed, _ in outcomes]
+    names = [name for name, _, _, _ in outcomes]
+    endpoints = {
+        endpoint: count - stub_before["endpoints"].get(endpoint, 0)
+        for endpoint, count in stub_after["endpoints"].items()
+        if count - stub_before["endpoints"].get(endpoint, 0)
+    }
+    return {
+        "requests": len(outcomes),
+        "errors": sum(1 for _, status, _, _ in outcomes if status != 200),
+        "requests_per_second": round(len(outcomes) / wall, 2) if wall else 0.0,
+        "latency_ms": {
+            "p50": round(percentile(latencies, 0.5), 1),
+            "p95": round(percentile(latencies, 0.95), 1),
+            "max": round(max(latencies, default=0.0), 1),
+        },
+        "stage_ms": stages,
+        "outbound_requests": http_after["requests"] - http_before["requests"],
+        "outbound_retries": http_after["retries"] - http_before["retries"],
+        "stub_throttled": stub_after["throttled"] - stub_before["throttled"],
+        "stub_endpoints": endpoints,
+        "peak_rss_mb": peak_rss_mb(),
+        # Only meaningful when every case ran once
+        "per_case_ms": {name: round(elapsed * 1000, 1) for name, _, elapsed, _ in outcomes} if len(names) == len(set(names)) else None,
+    }
+
+
+def print_phase(name, result, baseline=None):
+    def compare(value, path):
+        reference = baseline
+        for key in path:
+            reference = reference.get(key) if isinstance(reference, dict) else None
+        if not isinstance(reference, (int, float)) or isinstance(reference, bool):
+            return f"{value}"
+        change = f"{(value - reference) / reference * 100:+.0f}%" if reference else "n/a"
+        return f"{value} (baseline {reference}, {change})"
+
+    print(f"{name}: {result['requests']} requests, {result['errors']} errors")
+    print(f"  throughput  {compare(result['requests_per_second'], ['requests_per_second'])} req/s")
+    for key in ("p50", "p95", "max"):
+        print(f"  latency {key:<4}{compare(result['latency_ms'][key], ['latency_ms', key])} ms")
+    for stage_name, milliseconds in sorted(result["stage_ms"].items(), key=lambda item: -item[1]):
+        print(f"  stage {stage_name:<15}{compare(milliseconds, ['stage_ms', stage_name])} ms")
+    print(f"  outbound    {compare(result['outbound_requests'], ['outbound_requests'])} requests, "
+          f"{result['outbound_retries']} retries, {result['stub_throttled']} answered 429")
+    print(f"  endpoints   {json.dumps(result['stub_endpoints'], sort_keys=True)}")
+    print(f"  peak RSS    {compare(result['peak_rss_mb'], ['peak_rss_mb'])} MB")
+    if result["per_case_ms"]:
+        for case, milliseconds in result["per_case_ms"].items():
+            print(f"  case {case:<28}{compare(milliseconds, ['per_case_ms', case])} ms")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=5, help="Copies of each page in the load phase, rounds in the cached phase")
+    parser.add_argument("--latency-ms", type=float, default=50, help="Latency the stub adds to every response")
+    parser.add_argument("--stub-rate", type=float, default=50, help="Requests per second the stub accepts before answering 429")
+    parser.add_argument("--throttle-ratio", type=float, default=0.0, help="Share of stub responses that are 429 regardless of the rate")
+    parser.add_argument("--client-rate", type=float, default=1000, help="The app's own per-host rate limit for the stub")
+    parser.add_argument("--save-baseline", help="Write the results to this JSON file")
+    parser.add_argument("--baseline", help="Compare against results saved with --save-baseline")
+    args = parser.parse_args(argv)
+
+    server = start_stub_server(rate=args.stub_rate, burst=args.stub_rate, latency_ms=args.latency_ms, throttle_ratio=args.throttle_ratio)
+    base_url = f"http://127.0.0.1:{server.server_port}"
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as file:
+            baseline = json.load(file)
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        configure_app_environment(base_url, data_dir, args.client_rate)
+        started = time.perf_counter()
+        import app  # noqa: E402 (reads the environment set above)
+        startup_seconds = time.perf_counter() - started
+        results = {
+            "settings": vars(args),
+            "startup": {"seconds": round(startup_seconds, 2), "peak_rss_mb": peak_rss_mb()},
+        }
+        print(f"App imported in {startup_seconds:.1f}s, peak RSS {results['startup']['peak_rss_mb']} MB; stub at {base_url}")
+
+        cold_cases = [(name, "/doi2graph", body) for name, body in DOI_CASES]
+        cold_cases += [(f"url_{os.path.basename(page)}", "/url2graph", {"url": f"{base_url}/articles/{page}"}) for page in PAGES]
+        load_cases = [
+            (f"url_{os.path.basename(page)}", "/url2graph", {"url": f"{base_url}/articles/{page}?copy={copy}"})
+            for copy in range(args.repeat) for page in PAGES
+        ]
+        cached_cases = [(name, "/doi2graph", body) for _ in range(args.repeat) for name, body in DOI_CASES]
+
+        for phase, cases, concurrency in (("cold", cold_cases, 1), ("load", load_cases, args.concurrency), ("cached", cached_cases, args.concurrency)):
+            results[phase] = run_phase(app, cases, concurrency, base_url)
+            print_phase(phase, results[phase], baseline.get(phase) if baseline else None)
+
+    server.shutdown()
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=2)
+        print(f"Saved results to {args.save_baseline}")
+
+
+if __name__ == "__main__":
+    main()
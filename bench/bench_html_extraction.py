@@ -0,0 +1,62 @@
+"""
+Compares the original HTML flattening (html.parser + get_text) with html_extraction on saved pages.
+
+    python bench/bench_html_extraction.py [pages_dir] [--repeat 20] [--ner]
+
+--ner also runs the app's NER on both texts and counts the entities that would be sent to linking
+(this loads the spaCy model).
+"""
+import argparse
+import glob
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from bs4 import BeautifulSoup  # noqa: E402
+from html_extraction import HTML_PARSER, extract_text_from_html  # noqa: E402
+
+
+def baseline_extract(content):
+    return BeautifulSoup(content, 'html.parser').get_text(separator="\n").strip()
+
+
+def time_extraction(extract, content, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        text = extract(content)
+    return (time.perf_counter() - started) / repeat * 1000, text
+
+
+def linkable_entity_count(app, text):
+    return sum(1 for entity in app.perform_ner_with_text(text) if entity['type'] not in app.UNLINKABLE_ENTITY_TYPES)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pages_dir", nargs="?", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "fixtures", "html"))
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--main-content", action="store_true")
+    parser.add_argument("--ner", action="store_true")
+    args = parser.parse_args(argv)
+
+    app = None
+    if args.ner:
+        import app
+
+    print(f"parser backend: {HTML_PARSER}; main_content={args.main_content}")
+    print(f"{'page':<32} {'old ms':>8} {'new ms':>8} {'old chars':>10} {'new chars':>10}" + (f" {'old ents':>9} {'new ents':>9}" if app else ""))
+    for path in sorted(glob.glob(os.path.join(args.pages_dir, "*.htm*"))):
+        with open(path, "rb") as page:
+            content = page.read()
+        old_ms, old_text = time_extraction(baseline_extract, content, args.repeat)
+        new_ms, new_text = time_extraction(lambda c: extract_text_from_html(c, main_content=args.main_content), content, args.repeat)
+        line = f"{os.path.basename(path):<32} {old_ms:>8.2f} {new_ms:>8.2f} {len(old_text):>10} {len(new_text):>10}"
+        if app:
+            line += f" {linkable_entity_count(app, old_text):>9} {linkable_entity_count(app, new_text):>9}"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
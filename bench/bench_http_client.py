@@ -0,0 +1,84 @@
+"""
+Exercises http_client against the local stub server: several worker processes share one
+per-host token bucket, so together they should stay under the stub's rate limit and see few
+or no 429s. Then a failing endpoint trips the circuit breaker.
+
+    python bench/bench_http_client.py [--processes 4] [--requests 20] [--rate 5] [--no-limit]
+
+--no-limit gives each process an effectively unlimited bucket, which is how the app behaved
+before: every worker throttled only itself.
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from http_client import CircuitBreaker, CircuitOpenError, HostRateLimiter, HttpClient  # noqa: E402
+from stub_server import start_stub_server  # noqa: E402
+
+
+def run_worker(base_url, limiter_path, rate, requests_per_worker, results):
+    client = HttpClient(HostRateLimiter(limiter_path, {"127.0.0.1": (rate, rate)}, None), timeout=(2, 10), max_retries=6)
+    statuses = []
+    for _ in range(requests_per_worker):
+        statuses.append(client.get(f"{base_url}/w/api.php").status_code)
+    results.put((statuses, client.stats()))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--rate", type=float, default=5)
+    parser.add_argument("--no-limit", action="store_true")
+    args = parser.parse_args(argv)
+
+    server = start_stub_server(rate=args.rate, burst=args.rate)
+    base_url = f"http://127.0.0.1:{server.server_port}"
+    client_rate = 1000 if args.no_limit else args.rate
+    context = multiprocessing.get_context("fork")
+    results = context.Queue()
+
+    with tempfile.TemporaryDirectory() as directory:
+        limiter_path = os.path.join(directory, "rate_limits.sqlite3")
+        started = time.perf_counter()
+        workers = [
+            context.Process(target=run_worker, args=(base_url, limiter_path, client_rate, args.requests, results))
+            for _ in range(args.processes)
+        ]
+        for worker in workers:
+            worker.start()
+        outcomes = [results.get() for _ in workers]
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - started
+
+    statuses = [status for worker_statuses, _ in outcomes for status in worker_statuses]
+    retries = sum(stats["retries"] for _, stats in outcomes)
+    stub_stats = requests.get(f"{base_url}/_stats").json()
+    print(f"{args.processes} processes x {args.requests} requests, stub limit {args.rate}/s, client limit {'none' if args.no_limit else client_rate}/s")
+    print(f"  elapsed {elapsed:.1f}s, {len(statuses) / elapsed:.1f} req/s, ok {statuses.count(200)}, gave up {len(statuses) - statuses.count(200)}")
+    print(f"  stub served {stub_stats['served']}, answered 429 {stub_stats['throttled']} times; client retries {retries}")
+
+    breaker_client = HttpClient(
+        HostRateLimiter(os.path.join(tempfile.gettempdir(), f"breaker-{os.getpid()}.sqlite3"), {}, None),
+        max_retries=0, circuit_breaker=CircuitBreaker(failure_threshold=3, reset_timeout=60),
+    )
+    outcomes = []
+    for _ in range(6):
+        try:
+            outcomes.append(breaker_client.get(f"{base_url}/fail").status_code)
+        except CircuitOpenError:
+            outcomes.append("open")
+    print(f"  /fail outcomes with a 3-failure breaker: {outcomes}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
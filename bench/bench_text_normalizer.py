@@ -0,0 +1,109 @@
+"""
+Compares the original regex cleaning (three re.sub passes, a split and a split per paragraph)
+with text_normalizer.iter_paragraphs on multi-megabyte inputs, and the original two-re.sub
+entity length filter with text_normalizer.linkable_text_length.
+
+    python bench/bench_text_normalizer.py [--sizes-mb 1 4 16] [--repeat 3]
+
+Inputs are built from the recorded pages in fixtures/html, with the blank runs, tabs, short
+lines and '|' separators of extracted HTML and PDF text. Peak memory is measured with
+tracemalloc (which slows both sides down equally), time without it.
+"""
+import argparse
+import glob
+import os
+import random
+import re
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from bs4 import BeautifulSoup  # noqa: E402
+from text_normalizer import iter_paragraphs, linkable_text_length  # noqa: E402
+
+newlines_pattern = re.compile(r' *[\n|\r|\r\n]+ *')
+whitespace_pattern = re.compile(r'[\t\f\v ]+')
+paragraph_split_pattern = re.compile(r'\n')
+
+
+def baseline_paragraphs(text):
+    no_space_text = whitespace_pattern.sub(' ', text)
+    no_multiple_lines_text = newlines_pattern.sub('\n', no_space_text)
+    no_multiple_lines_text_2 = newlines_pattern.sub('\n', no_multiple_lines_text)
+    paragraphs = paragraph_split_pattern.split(no_multiple_lines_text_2)
+    return [para for para in paragraphs if len(para.split()) > 5]
+
+
+def normalized_paragraphs(text):
+    return [paragraph.text for paragraph in iter_paragraphs(text)]
+
+
+def baseline_is_linkable(text):
+    return len(re.sub(r'\s+', ' ', re.sub(r'[^\w\s]', '', text)).strip()) >= 3
+
+
+def is_linkable(text):
+    return linkable_text_length(text, 3) >= 3
+
+
+def build_input(size, seed=0):
+    """
+    Returns:
+        str: About `size` characters of extracted-looking text.
+    """
+    lines = []
+    for path in sorted(glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "fixtures", "html", "*.htm*"))):
+        with open(path, "rb") as page:
+            lines += [line for line in BeautifulSoup(page.read(), "html.parser").get_text("\n").split("\n") if line.strip()]
+    noise = ["  ", "\t", "   \t ", " | ", "\n\n", "\r\n", "\n \n  "]
+    rnd = random.Random(seed)
+    parts = []
+    length = 0
+    while length < size:
+        words = rnd.choice(lines).split()
+        line = " ".join(word + (rnd.choice(noise) if rnd.random() < 0.05 else "") for word in words)
+        parts.append(line)
+        parts.append(rnd.choice(["\n", "\n\n", " \n", "\t\n", "|"]))
+        length += len(line) + 1
+    return "".join(parts)
+
+
+def measure(function, argument, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = function(argument)
+    elapsed = (time.perf_counter() - started) / repeat
+    tracemalloc.start()
+    function(argument)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed * 1000, peak / (1024 * 1024), result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes-mb", type=float, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    print(f"{'input':>8} {'old ms':>9} {'new ms':>9} {'old peak MB':>12} {'new peak MB':>12} {'paragraphs':>11} {'same':>5}")
+    for size_mb in args.sizes_mb:
+        text = build_input(int(size_mb * 1024 * 1024))
+        old_ms, old_peak, old_paragraphs = measure(baseline_paragraphs, text, args.repeat)
+        new_ms, new_peak, new_paragraphs = measure(normalized_paragraphs, text, args.repeat)
+        # The normalizer also trims the blanks the original left at the start and end of the text
+        same = [paragraph.strip(" ") for paragraph in old_paragraphs] == new_paragraphs
+        print(f"{size_mb:>6g}MB {old_ms:>9.1f} {new_ms:>9.1f} {old_peak:>12.1f} {new_peak:>12.1f} {len(new_paragraphs):>11} {str(same):>5}")
+
+    rnd = random.Random(1)
+    entities = [rnd.choice(["NIH", "U.S.", "A.", "Dr. Francis Collins", "e.g.", "COVID-19", "--", "Johns Hopkins University", "x y"])
+                for _ in range(200_000)]
+    old_ms, _, old_result = measure(lambda items: [baseline_is_linkable(item) for item in items], entities, args.repeat)
+    new_ms, _, new_result = measure(lambda items: [is_linkable(item) for item in items], entities, args.repeat)
+    print(f"entity filter, {len(entities)} entities: old {old_ms:.1f} ms, new {new_ms:.1f} ms, same {old_result == new_result}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+"""
+A local stand-in for the services the app calls, for benchmarks and manual checks without
+network access. The stub enforces its own rate limit and answers 429 (with Retry-After) once
+it is exceeded, like Wikidata and CrossRef do; --throttle-ratio also answers a share of the
+requests with 429 at random.
+
+    python bench/stub_server.py [--port 8099] [--rate 5] [--burst 5] [--latency-ms 20] [--throttle-ratio 0]
+
+    GET /w/api.php?action=wbsearchentities&search=...  -> deterministic candidates for the search
+    GET /sparql?query=...     -> every item of the query's VALUES clause (all candidates match)
+    GET /works/<doi>          -> the CrossRef record of a fixture work, or 404
+    GET /works?query=...      -> CrossRef works search with cursor pagination
+    GET /doi/<doi>            -> 302 redirect to the work's recorded full text
+    GET /articles/<path>      -> a recorded HTML or PDF page from fixtures/ (query strings are ignored)
+    GET /fail                 -> always 500 (for exercising the circuit breaker)
+    GET /_stats               -> counts of served, throttled and failed requests, per endpoint
+
+Point the app at it with WIKIDATA_API_URL=<base>/w/api.php, WIKIDATA_SPARQL_URL=<base>/sparql,
+CROSSREF_API_URL=<base> and DOI_RESOLVER_URL=<base>/doi.
+"""
+import argparse
+import json
+import mimetypes
+import os
+import random
+import re
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote, unquote, urlsplit
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "fixtures")
+SPARQL_VALUES_PATTERN = re.compile(r"VALUES \?item \{([^}]*)\}")
+
+
+def load_works(fixtures_dir):
+    with open(os.path.join(fixtures_dir, "crossref", "works.json"), encoding="utf-8") as file:
+        data = json.load(file)
+    return {work["DOI"].lower(): work for work in data["works"]}, {doi.lower(): path for doi, path in data["full_text"].items()}
+
+
+def search_candidates(search, limit):
+    # Stable ids per search text, so repeated runs link the same entities
+    base = zlib.crc32(search.lower().encode()) % 10_000_000
+    return [
+        {"id": f"Q{base * 10 + rank}", "label": search, "description": f"stub candidate {rank + 1} for {search}"}
+        for rank in range(min(limit, 3))
+    ]
+
+
+class StubState:
+    def __init__(self, rate, burst, latency_ms, throttle_ratio=0.0, fixtures_dir=FIXTURES_DIR):
+        self.rate = rate
+        self.burst = burst
+        self.latency = latency_ms / 1000
+        self.throttle_ratio = throttle_ratio
+        self.fixtures_dir = fixtures_dir
+        self.works, self.full_text = load_works(fixtures_dir)
+        self.tokens = burst
+        self.updated_at = time.monotonic()
+        self.counts = {"served": 0, "throttled": 0, "failed": 0}
+        self.endpoints = {}
+        self.random = random.Random(0)
+        self.lock = threading.Lock()
+
+    def admit(self):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+            if self.tokens < 1 or self.random.random() < self.throttle_ratio:
+                self.counts["throttled"] += 1
+                return False
+            self.tokens -= 1
+            return True
+
+    def count(self, name, endpoint=None):
+        with self.lock:
+            self.counts[name] += 1
+            if endpoint:
+                self.endpoints[endpoint] = self.endpoints.get(endpoint, 0) + 1
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counts, endpoints=dict(self.endpoints))
+
+
+def make_handler(state):
+    class StubHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def send_body(self, status, payload, content_type, headers=None):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(payload)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def send_json(self, status, body, headers=None):
+            self.send_body(status, json.dumps(body).encode(), "application/json", headers)
+
+        def do_GET(self):
+            parts = urlsplit(self.path)
+            path = unquote(parts.path)
+            query = {name: values[0] for name, values in parse_qs(parts.query).items()}
+            if path == "/_stats":
+                return self.send_json(200, state.stats())
+            if path == "/fail":
+                state.count("failed")
+                return self.send_json(500, {"error": "stub failure"})
+            if not state.admit():
+                return self.send_json(429, {"error": "Too Many Requests"}, {"Retry-After": "1"})
+            time.sleep(state.latency)
+            if path == "/w/api.php":
+                state.count("served", "wbsearchentities")
+                return self.send_json(200, {"search": search_candidates(query.get("search", ""), int(query.get("limit", 7)))})
+            if path == "/sparql":
+                state.count("served", "sparql")
+                match = SPARQL_VALUES_PATTERN.search(query.get("query", ""))
+                items = match.group(1).split() if match else []
+                bindings = [{"item": {"value": f"http://www.wikidata.org/entity/{item.split(':')[-1]}"}} for item in items]
+                return self.send_json(200, {"results": {"bindings": bindings}})
+            if path == "/works":
+                state.count("served", "works_search")
+                return self.send_json(200, {"message": self.search_works(query)})
+            if path.startswith("/works/"):
+                state.count("served", "works")
+                work = state.works.get(path[len("/works/"):].lower())
+                if work is None:
+                    return self.send_json(404, {"error": "Resource not found."})
+                return self.send_json(200, {"status": "ok", "message": work})
+            if path.startswith("/doi/"):
+                state.count("served", "doi")
+                target = state.full_text.get(path[len("/doi/"):].lower())
+                if target is None:
+                    return self.send_json(404, {"error": "DOI not found"})
+                return self.send_body(302, b"", "text/plain", {"Location": f"/articles/{quote(target)}"})
+            if path.startswith("/articles/"):
+                return self.send_article(path[len("/articles/"):])
+            state.count("served")
+            self.send_json(404, {"error": "unknown stub endpoint"})
+
+        def search_works(self, query):
+            terms = query.get("query", "").lower().split()
+            matches = [
+                work for work in state.works.values()
+                if all(term in json.dumps(work).lower() for term in terms)
+            ]
+            rows = int(query.get("rows", 20))
+            cursor = query.get("cursor", "*")
+            offset = 0 if cursor == "*" else int(cursor)
+            return {
+                "total-results": len(matches),
+                "items": matches[offset:offset + rows],
+                "next-cursor": str(offset + rows),
+            }
+
+        def send_article(self, relative_path):
+            path = os.path.normpath(os.path.join(state.fixtures_dir, relative_path))
+            if not path.startswith(os.path.normpath(state.fixtures_dir) + os.sep) or not os.path.isfile(path):
+                state.count("served")
+                return self.send_json(404, {"error": "fixture not found"})
+            state.count("served", "articles")
+            with open(path, "rb") as file:
+                payload = file.read()
+            content_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+            if content_type.startswith("text/"):
+                content_type += "; charset=utf-8"
+            self.send_body(200, payload, content_type)
+
+        def log_message(self, format, *args):
+            pass
+
+    return StubHandler
+
+
+def start_stub_server(port=0, rate=5, burst=5, latency_ms=20, throttle_ratio=0.0, fixtures_dir=FIXTURES_DIR):
+    """
+    Starts the stub server on a background thread.
+
+    Args:
+        port (int): The port, or 0 for any free port.
+        rate (float): Requests per second the stub accepts before answering 429.
+        burst (float): Requests accepted at once.
+        latency_ms (float): Added to every successful response.
+        throttle_ratio (float): Share of requests answered with 429 regardless of the rate.
+        fixtures_dir (str): Where the CrossRef works and the recorded pages are.
+
+    Returns:
+        ThreadingHTTPServer: The running server (its base URL is f"http://127.0.0.1:{server.server_port}").
+    """
+    state = StubState(rate, burst, latency_ms, throttle_ratio, fixtures_dir)
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(state))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--rate", type=float, default=5)
+    parser.add_argument("--burst", type=float, default=5)
+    parser.add_argument("--latency-ms", type=float, default=20)
+    parser.add_argument("--throttle-ratio", type=float, default=0.0)
+    args = parser.parse_args(argv)
+    server = start_stub_server(args.port, args.rate, args.burst, args.latency_ms, args.throttle_ratio)
+    print(f"Stub server listening on http://127.0.0.1:{server.server_port}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
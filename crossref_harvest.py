@@ -0,0 +1,179 @@
+import logging
+import queue
+import threading
+import time
+from collections import deque
+
+import requests
+
+CROSSREF_WORKS_URL = "https://api.crossref.org/works"
+# CrossRef's deep-paging limit per request
+CROSSREF_MAX_ROWS = 1000
+# Only the fields the harvester reads; full work records are several KB each
+CROSSREF_SELECT_FIELDS = "DOI,title,abstract,is-referenced-by-count"
+
+_END = object()
+
+
+def iter_crossref_pages(keyword, rows=CROSSREF_MAX_ROWS, max_results=None, get=requests.get, mailto=None,
+                        max_retries=5, works_url=CROSSREF_WORKS_URL):
+    """
+    Pages through the CrossRef works matching a keyword with a deep-paging cursor.
+
+    Args:
+        keyword (str): The query.
+        rows (int): Works per page, at most CROSSREF_MAX_ROWS.
+        max_results (int, optional): Stop after this many works.
+        get (callable): Sends the requests, e.g. the app's shared HttpClient.get.
+        mailto (str, optional): Contact address, which puts requests in CrossRef's polite pool.
+        max_retries (int): Attempts per page; 1 when `get` retries by itself (see fetch_crossref_page).
+        works_url (str): The /works endpoint.
+
+    Yields:
+        dict: One page: 'total_results' and 'items' (the raw work records).
+    """
+    rows = max(1, min(int(rows), CROSSREF_MAX_ROWS))
+    params = {"query": keyword, "rows": rows, "cursor": "*", "select": CROSSREF_SELECT_FIELDS}
+    if mailto:
+        params["mailto"] = mailto
+    harvested = 0
+    while True:
+        if max_results:
+            params["rows"] = min(rows, max_results - harvested)
+        message = fetch_crossref_page(params, get, max_retries, works_url)
+        items = message.get("items", [])
+        if max_results:
+            items = items[:max_results - harvested]
+        harvested += len(items)
+        yield {"total_results": message.get("total-results", 0), "items": items}
+        # An empty page marks the end of the cursor
+        if not items or (max_results and harvested >= max_results) or not message.get("next-cursor"):
+            return
+        params["cursor"] = message["next-cursor"]
+
+
+def fetch_crossref_page(params, get=requests.get, max_retries=5, works_url=CROSSREF_WORKS_URL):
+    """
+    Fetches one page of /works results, retrying failures with exponential backoff. Losing a
+    cursor means starting over, so pages are retried harder than single lookups. A `get` that
+    already retries (the app's HttpClient.get) owns the retries: pass max_retries=1, or every
+    throttled page is retried max_retries times over.
+
+    Args:
+        params (dict): The query parameters, including the cursor.
+        get (callable): Sends the request.
+        max_retries (int): Attempts before giving up (1 for a single attempt).
+        works_url (str): The /works endpoint.
+
+    Returns:
+        dict: The response's 'message'.
+    """
+    delay = 1
+    for attempt in range(1, max_retries + 1):
+        try:
+            response = get(works_url, params=params)
+            response.raise_for_status()
+            return response.json().get("message", {})
+        except requests.exceptions.RequestException as e:
+            if attempt == max_retries:
+                raise
+            logging.warning(f"CrossRef page request failed ({e}), retrying in {delay} seconds...")
+            time.sleep(delay)
+            delay *= 2
+
+
+def prefetch(iterable, depth=1):
+    """
+    Consumes an iterable on a background thread, keeping at most `depth` items buffered, so the
+    next item (e.g. the next page of results) is fetched while the caller works on the current one.
+
+    Args:
+        iterable (iterable): The source.
+        depth (int): Items buffered ahead of the caller.
+
+    Yields:
+        The items of `iterable`, in order. An exception raised by the source is re-raised here.
+    """
+    buffer = queue.Queue(maxsize=max(1, depth))
+    stopped = threading.Event()
+
+    def put(entry):
+        while not stopped.is_set():
+            try:
+                buffer.put(entry, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put((item, None)):
+                    return
+            put((_END, None))
+        except Exception as e:
+            put((_END, e))
+
+    producer = threading.Thread(target=produce, name="prefetch", daemon=True)
+    producer.start()
+    try:
+        while True:
+            item, error = buffer.get()
+            if item is _END:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        # The caller stopped early (e.g. the client disconnected): let the producer exit
+        stopped.set()
+
+
+def bounded_map(function, iterable, executor, window):
+    """
+    Like executor.map, but only pulls `window` items ahead of the caller, so an unbounded source
+    is processed concurrently in constant memory.
+
+    Args:
+        function (callable): Applied to each item.
+        iterable (iterable): The items.
+        executor (Executor): Runs the calls.
+        window (int): Calls in flight at most.
+
+    Yields:
+        tuple: (item, future) in input order; the future is done.
+    """
+    in_flight = deque()
+    try:
+        for item in iterable:
+            in_flight.append((item, executor.submit(function, item)))
+            if len(in_flight) >= window:
+                item, future = in_flight.popleft()
+                future.exception()
+                yield item, future
+        while in_flight:
+            item, future = in_flight.popleft()
+            future.exception()
+            yield item, future
+    finally:
+        for _, future in in_flight:
+            future.cancel()
+
+
+def iter_crossref_works(keyword, prefetch_pages=1, **page_options):
+    """
+    Streams the CrossRef works matching a keyword, fetching the next page in the background
+    while the current one is consumed.
+
+    Args:
+        keyword (str): The query.
+        prefetch_pages (int): Pages fetched ahead of the caller.
+        **page_options: Passed to iter_crossref_pages.
+
+    Yields:
+        tuple: (the raw work record, the query's total number of results).
+    """
+    for page in prefetch(iter_crossref_pages(keyword, **page_options), prefetch_pages):
+        for item in page["items"]:
+            yield item, page["total_results"]
@@ -0,0 +1,177 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from sqlite_connections import SQLiteConnections
+
+
+DOCUMENT_CACHE_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS documents ("
+    " key TEXT PRIMARY KEY,"
+    " etag TEXT,"
+    " last_modified TEXT,"
+    " content_hash TEXT,"
+    " graph TEXT NOT NULL,"
+    " size INTEGER NOT NULL,"
+    " accessed_at REAL NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS documents_accessed_at ON documents (accessed_at)",
+)
+
+
+def content_hash(content):
+    """
+    Args:
+        content (bytes): The fetched document body.
+
+    Returns:
+        str: The SHA-256 hex digest of the body.
+    """
+    return hashlib.sha256(content).hexdigest()
+
+
+class DocumentCache:
+    """
+    Stores the graph built for each URL or DOI together with the validators needed to tell
+    whether the source changed: the ETag/Last-Modified headers and a hash of the fetched content.
+
+    The total size of stored graphs is capped at `max_bytes`; the least recently used documents
+    are evicted first.
+    """
+
+    def __init__(self, path, max_bytes):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._connections = SQLiteConnections(path, DOCUMENT_CACHE_SCHEMA)
+        self._lock = threading.Lock()
+        self._stats = {"immutable_hits": 0, "not_modified_hits": 0, "unchanged_hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _connection(self):
+        return self._connections.get()
+
+    def count(self, name):
+        """
+        Increments one of the hit/miss counters.
+
+        Args:
+            name (str): 'immutable_hits', 'not_modified_hits', 'unchanged_hits' or 'misses'.
+        """
+        with self._lock:
+            self._stats[name] += 1
+
+    def get(self, key):
+        """
+        Args:
+            key (str): The URL or DOI.
+
+        Returns:
+            dict: 'etag', 'last_modified', 'content_hash' and 'graph', or None if not cached.
+        """
+        try:
+            row = self._connection().execute(
+                "SELECT etag, last_modified, content_hash, graph FROM documents WHERE key = ?", (key,)
+            ).fetchone()
+        except sqlite3.Error as e:
+            logging.warning(f"Document cache read failed: {e}")
+            return None
+        if row is None:
+            return None
+        return {"etag": row[0], "last_modified": row[1], "content_hash": row[2], "graph": json.loads(row[3])}
+
+    def touch(self, key, etag=None, last_modified=None):
+        """
+        Marks a document as recently used, refreshing its validators when new ones were received.
+
+        Args:
+            key (str): The URL or DOI.
+            etag (str, optional): The latest ETag.
+            last_modified (str, optional): The latest Last-Modified header.
+        """
+        try:
+            connection = self._connection()
+            connection.execute(
+                "UPDATE documents SET accessed_at = ?, etag = COALESCE(?, etag), last_modified = COALESCE(?, last_modified) WHERE key = ?",
+                (time.time(), etag, last_modified, key)
+            )
+            connection.commit()
+        except sqlite3.Error as e:
+            logging.warning(f"Document cache update failed: {e}")
+
+    def conditional_headers(self, entry):
+        """
+        Args:
+            entry (dict): A cached entry returned by get().
+
+        Returns:
+            dict: If-None-Match / If-Modified-Since headers for revalidating the entry.
+        """
+        headers = {}
+        if entry and entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry and entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def put(self, key, graph, content_hash=None, etag=None, last_modified=None):
+        """
+        Stores the graph for a document and evicts the least recently used ones over the size cap.
+
+        Args:
+            key (str): The URL or DOI.
+            graph (dict): The graph returned to the client.
+            content_hash (str, optional): Hash of the fetched content.
+            etag (str, optional): The response ETag.
+            last_modified (str, optional): The response Last-Modified header.
+        """
+        serialized = json.dumps(graph)
+        try:
+            connection = self._connection()
+            connection.execute(
+                "INSERT OR REPLACE INTO documents (key, etag, last_modified, content_hash, graph, size, accessed_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, etag, last_modified, content_hash, serialized, len(serialized), time.time())
+            )
+            evicted = self._evict(connection)
+            connection.commit()
+        except sqlite3.Error as e:
+            logging.warning(f"Document cache write failed: {e}")
+            return
+        with self._lock:
+            self._stats["stores"] += 1
+            self._stats["evictions"] += evicted
+
+    def _evict(self, connection):
+        total = connection.execute("SELECT COALESCE(SUM(size), 0) FROM documents").fetchone()[0]
+        evicted = 0
+        if total <= self.max_bytes:
+            return evicted
+        for key, size in connection.execute("SELECT key, size FROM documents ORDER BY accessed_at").fetchall():
+            if total <= self.max_bytes:
+                break
+            connection.execute("DELETE FROM documents WHERE key = ?", (key,))
+            total -= size
+            evicted += 1
+        return evicted
+
+    def stats(self):
+        """
+        Returns:
+            dict: Hit/miss counters plus the number and total size of stored documents.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+        try:
+            documents, size = self._connection().execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM documents"
+            ).fetchone()
+            stats.update({"documents": documents, "bytes": size})
+        except sqlite3.Error:
+            pass
+        hits = stats["immutable_hits"] + stats["not_modified_hits"] + stats["unchanged_hits"]
+        stats["hit_ratio"] = hits / (hits + stats["misses"]) if hits + stats["misses"] else 0.0
+        return stats
@@ -0,0 +1,208 @@
+import logging
+import os
+import sqlite3
+import time
+import uuid
+
+from lookup_cache import normalize_lookup_text
+from sqlite_connections import SQLiteConnections
+
+# Namespace for the stable node IDs derived from node keys
+NODE_ID_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_URL, "https://github.com/fedevela/gcp-spacy-nel/node")
+DOCUMENT_NODE_TYPES = ("DOI", "URL")
+
+GRAPH_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS nodes ("
+    " id TEXT PRIMARY KEY,"
+    " key TEXT NOT NULL UNIQUE,"
+    " text TEXT NOT NULL,"
+    " type TEXT NOT NULL,"
+    " wikidata_id TEXT,"
+    " wikidata_label TEXT,"
+    " wikidata_description TEXT,"
+    " updated_at REAL NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS mentions ("
+    " source TEXT NOT NULL,"
+    " target TEXT NOT NULL,"
+    " added_at REAL NOT NULL,"
+    " PRIMARY KEY (source, target))",
+    "CREATE INDEX IF NOT EXISTS mentions_target ON mentions (target)",
+    "CREATE INDEX IF NOT EXISTS nodes_wikidata_id ON nodes (wikidata_id)",
+)
+
+
+def node_key(node):
+    """
+    Args:
+        node (dict): A graph node.
+
+    Returns:
+        str: What identifies the node across documents: the DOI or URL for document nodes, the
+            Wikidata ID for linked entities, and the type and normalized text for unlinked ones.
+    """
+    if node['type'] == 'DOI':
+        return f"DOI:{node['text'].lower()}"
+    if node['type'] == 'URL':
+        return f"URL:{node['text']}"
+    if node.get('wikidata_id'):
+        return f"wikidata:{node['wikidata_id']}"
+    return f"text:{node['type']}:{normalize_lookup_text(node['text'])}"
+
+
+def node_id(node):
+    """
+    Args:
+        node (dict): A graph node.
+
+    Returns:
+        str: A node ID that is the same in every response and in the graph store.
+    """
+    return str(uuid.uuid5(NODE_ID_NAMESPACE, node_key(node)))
+
+
+class GraphStore:
+    """
+    Accumulates the graphs built for every document into one SQLite graph: nodes are upserted by
+    node_key, so an entity mentioned by many documents is a single node, and each document's
+    MENTION links are kept as edges from its document node. Re-adding a document replaces its edges.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._connections = SQLiteConnections(path, GRAPH_SCHEMA, row_factory=sqlite3.Row)
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _connection(self):
+        return self._connections.get()
+
+    def add_graph(self, graph):
+        """
+        Upserts the nodes of a document graph and replaces the document's MENTION edges.
+
+        Args:
+            graph (dict): A graph with 'nodes' and 'links', as built by the app.
+        """
+        now = time.time()
+        nodes_by_id = {node['id']: node for node in graph['nodes']}
+        sources = {link['source'] for link in graph['links']}
+        try:
+            connection = self._connection()
+            with connection:
+                connection.executemany(
+                    "INSERT INTO nodes (id, key, text, type, wikidata_id, wikidata_label, wikidata_description, updated_at)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+                    " ON CONFLICT(id) DO UPDATE SET"
+                    " wikidata_label = COALESCE(excluded.wikidata_label, wikidata_label),"
+                    " wikidata_description = COALESCE(excluded.wikidata_description, wikidata_description),"
+                    " updated_at = excluded.updated_at",
+                    [
+                        (node['id'], node_key(node), node['text'], node['type'], node.get('wikidata_id'),
+                         node.get('wikidata_label'), node.get('wikidata_description'), now)
+                        for node in nodes_by_id.values()
+                    ]
+                )
+                connection.executemany("DELETE FROM mentions WHERE source = ?", [(source,) for source in sources])
+                connection.executemany(
+                    "INSERT OR IGNORE INTO mentions (source, target, added_at) VALUES (?, ?, ?)",
+                    [(link['source'], link['target'], now) for link in graph['links'] if link['type'] == 'MENTION']
+                )
+        except sqlite3.Error as e:
+            logging.warning(f"Graph store write failed: {e}")
+
+    def resolve(self, reference):
+        """
+        Args:
+            reference (str): A node ID or a Wikidata ID.
+
+        Returns:
+            str: The node ID, or None if the store has no such node.
+        """
+        row = self._connection().execute(
+            "SELECT id FROM nodes WHERE id = ? OR key = ?", (reference, f"wikidata:{reference}")
+        ).fetchone()
+        return row['id'] if row else None
+
+    def get_node(self, node_id):
+        """
+        Args:
+            node_id (str): The node ID.
+
+        Returns:
+            dict: The node with its 'mentions' count, or None if unknown.
+        """
+        row = self._connection().execute(
+            "SELECT n.*, (SELECT COUNT(*) FROM mentions m WHERE m.target = n.id OR m.source = n.id) AS mentions"
+            " FROM nodes n WHERE n.id = ?", (node_id,)
+        ).fetchone()
+        return self._node(row) if row else None
+
+    def neighbors(self, node_id, limit=100):
+        """
+        For an entity, the entities mentioned in the same documents, most shared documents first;
+        for a document, the entities it mentions.
+
+        Args:
+            node_id (str): The node ID.
+            limit (int): The maximum number of neighbors.
+
+        Returns:
+            list: Nodes with a 'shared_documents' count.
+        """
+        connection = self._connection()
+        row = connection.execute("SELECT type FROM nodes WHERE id = ?", (node_id,)).fetchone()
+        if row is None:
+            return []
+        if row['type'] in DOCUMENT_NODE_TYPES:
+            query = (
+                "SELECT n.*, 1 AS shared_documents FROM mentions m JOIN nodes n ON n.id = m.target"
+                " WHERE m.source = ? ORDER BY n.text LIMIT ?"
+            )
+        else:
+            query = (
+                "SELECT n.*, COUNT(*) AS shared_documents FROM mentions own"
+                " JOIN mentions other ON other.source = own.source AND other.target != own.target"
+                " JOIN nodes n ON n.id = other.target"
+                " WHERE own.target = ?"
+                " GROUP BY n.id ORDER BY shared_documents DESC, n.text LIMIT ?"
+            )
+        return [self._node(row) for row in connection.execute(query, (node_id, limit)).fetchall()]
+
+    def documents(self, node_ids, limit=100):
+        """
+        Args:
+            node_ids (list): Entity node IDs.
+            limit (int): The maximum number of documents.
+
+        Returns:
+            list: The document nodes that mention every one of the entities.
+        """
+        node_ids = list(dict.fromkeys(node_ids))
+        if not node_ids:
+            return []
+        placeholders = ", ".join("?" * len(node_ids))
+        return [self._node(row) for row in self._connection().execute(
+            f"SELECT n.* FROM mentions m JOIN nodes n ON n.id = m.source"
+            f" WHERE m.target IN ({placeholders})"
+            f" GROUP BY n.id HAVING COUNT(DISTINCT m.target) = ? ORDER BY n.text LIMIT ?",
+            (*node_ids, len(node_ids), limit)
+        ).fetchall()]
+
+    def stats(self):
+        """
+        Returns:
+            dict: The number of document nodes, entity nodes and MENTION edges.
+        """
+        connection = self._connection()
+        placeholders = ", ".join("?" * len(DOCUMENT_NODE_TYPES))
+        documents, total = connection.execute(
+            f"SELECT COALESCE(SUM(type IN ({placeholders})), 0), COUNT(*) FROM nodes", DOCUMENT_NODE_TYPES
+        ).fetchone()
+        entities = total - documents
+        mentions = connection.execute("SELECT COUNT(*) FROM mentions").fetchone()[0]
+        return {"documents": documents, "entities": entities, "mentions": mentions}
+
+    @staticmethod
+    def _node(row):
+        return {key: row[key] for key in row.keys() if key not in ("key", "updated_at")}
@@ -0,0 +1,50 @@
+# Production server configuration: gunicorn --config gunicorn.conf.py app:app
+import gc
+import logging
+import multiprocessing
+import os
+
+from metrics import REGISTRY
+from nlp_loader import process_memory_mb
+from pdf_extraction import start_pdf_executor
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8080')}"
+workers = int(os.environ.get("GUNICORN_WORKERS", multiprocessing.cpu_count()))
+threads = int(os.environ.get("GUNICORN_THREADS", 4))
+worker_class = "gthread"
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 300))  # Large PDFs take a while
+graceful_timeout = 30
+# Import app.py (and load the spaCy model) once in the parent; workers share those pages copy-on-write
+preload_app = True
+
+
+def when_ready(server):
+    # Move everything allocated so far out of the collector's reach, so garbage collection in the
+    # workers does not touch (and therefore copy) the model's objects
+    gc.collect()
+    gc.freeze()
+    # The stored metrics are summed over the workers of this server run only
+    REGISTRY.reset_store()
+    server.log.info(f"Parent loaded: {process_memory_mb()}; starting {workers} workers x {threads} threads")
+
+
+def post_fork(server, worker):
+    # Fork the PDF extraction processes before the worker starts its request threads
+    from app import PDF_EXTRACTION_WORKERS, batch_queue
+    start_pdf_executor(PDF_EXTRACTION_WORKERS)
+    # Resume batch jobs whose worker is gone (a restart, or a crashed worker being replaced)
+    batch_queue.recover()
+
+
+def worker_exit(server, worker):
+    # Store the observations made since the worker's last metrics flush
+    REGISTRY.flush()
+
+
+def post_worker_init(worker):
+    logging.info(f"Worker {worker.pid} ready: {process_memory_mb()}")
+
+
+def nworkers_changed(server, new_value, old_value):
+    for pid in list(server.WORKERS):
+        server.log.info(f"Worker {pid} memory: {process_memory_mb(pid)}")
@@ -0,0 +1,157 @@
+import re
+
+from bs4 import BeautifulSoup
+
+try:
+    from lxml import etree
+    from lxml import html as lxml_html
+    HTML_PARSER = "lxml"
+except ImportError:
+    HTML_PARSER = "html.parser"
+
+# Elements that never hold article text. <form> and <label> are not among them: ASP.NET and many
+# CMS pages wrap the whole body in a <form>
+BOILERPLATE_TAGS = [
+    "script", "style", "noscript", "template", "svg", "canvas", "iframe", "object",
+    "nav", "aside", "button", "select", "input", "textarea",
+]
+# Site-wide page chrome, unless it is an article's own header or footer
+CHROME_TAGS = ["header", "footer"]
+BOILERPLATE_ROLES = {"navigation", "banner", "contentinfo", "complementary", "search", "menu", "menubar", "dialog", "alert"}
+# Matched against each element's id and class names, one hyphen/underscore-separated word at a time
+boilerplate_name_pattern = re.compile(
+    r'(?:^|[-_\s])(?:cookies?|consent|gdpr|nav|navbar|navigation|menu|breadcrumbs?|sidebar|footer|masthead|'
+    r'share|sharing|social|newsletter|subscribe|subscription|advert|ads|promo|related|recommended|'
+    r'references?|bibliography|citations|ref-list|reflist|comments?|popup|modal|skip-link)(?:$|[-_\s])',
+    re.IGNORECASE
+)
+# Containers that must survive even if their class names look like boilerplate
+PROTECTED_TAGS = {"html", "body", "main", "article"}
+MAIN_CONTENT_SELECTORS = ["main", "[role=main]", "article", "#main-content", "#content", ".article-body"]
+# A boilerplate-looking element holding more than this share of the page text is a layout wrapper
+MAX_BOILERPLATE_TEXT_SHARE = 0.5
+MAIN_CONTENT_XPATHS = [
+    "//main", "//*[@role='main']", "//article", "//*[@id='main-content']", "//*[@id='content']",
+    "//*[contains(concat(' ', normalize-space(@class), ' '), ' article-body ')]",
+]
+
+
+def is_boilerplate(attributes):
+    """
+    Args:
+        attributes (dict): An element's attributes.
+
+    Returns:
+        bool: Whether the element looks like navigation, banners, references or other page chrome.
+    """
+    if attributes.get("role") in BOILERPLATE_ROLES or attributes.get("aria-hidden") == "true":
+        return True
+    classes = attributes.get("class") or ""
+    if isinstance(classes, list):
+        classes = " ".join(classes)
+    names = f"{attributes.get('id') or ''} {classes}"
+    return boilerplate_name_pattern.search(names) is not None
+
+
+def holds_main_content_lxml(element, page_text_length):
+    """
+    Args:
+        element (HtmlElement): An element that looks like boilerplate.
+        page_text_length (int): The length of the whole page's text.
+
+    Returns:
+        bool: Whether the element wraps the article (a <main>, <article> or role=main element,
+            or most of the page's text), so it must not be dropped.
+    """
+    if element.xpath(".//main|.//article|.//*[@role='main']"):
+        return True
+    return len(element.text_content()) > MAX_BOILERPLATE_TEXT_SHARE * page_text_length
+
+
+def holds_main_content_soup(element, page_text_length):
+    """
+    See holds_main_content_lxml.
+    """
+    if element.find(["main", "article"]) is not None or element.find(attrs={"role": "main"}) is not None:
+        return True
+    return len(element.get_text()) > MAX_BOILERPLATE_TEXT_SHARE * page_text_length
+
+
+def extract_text_from_html(content, encoding=None, main_content=False):
+    """
+    Extracts the readable text of an HTML page, without scripts, navigation, banners, footers
+    or reference lists.
+
+    Args:
+        content (bytes or str): The HTML document.
+        encoding (str, optional): The charset declared by the server, if any.
+        main_content (bool): Keep only the main article element when the page marks one up.
+
+    Returns:
+        str: The page text, one block per line.
+    """
+    if HTML_PARSER == "lxml":
+        return extract_text_with_lxml(content, encoding, main_content)
+    return extract_text_with_soup(content, encoding, main_content)
+
+
+def extract_text_with_lxml(content, encoding=None, main_content=False):
+    if not content or not content.strip():
+        return ""
+    parser = lxml_html.HTMLParser(encoding=encoding if isinstance(content, bytes) else None, remove_comments=True)
+    try:
+        root = lxml_html.document_fromstring(content, parser=parser)
+    except (etree.ParserError, ValueError):
+        return ""
+    etree.strip_elements(root, *BOILERPLATE_TAGS, with_tail=False)
+    page_text_length = len(root.text_content())
+    # Elements are collected first and then dropped. A dropped element keeps its descendants, so
+    # the ones still to come are skipped once they are no longer under the root
+    for element in list(root.iter(*CHROME_TAGS)):
+        ancestors = list(element.iterancestors())
+        if root in ancestors and not any(ancestor.tag in ("article", "main") for ancestor in ancestors) \
+                and not holds_main_content_lxml(element, page_text_length):
+            element.drop_tree()
+    for element in root.xpath("//*[@class or @id or @role or @aria-hidden]"):
+        if element.tag not in PROTECTED_TAGS and root in element.iterancestors() and is_boilerplate(element.attrib) \
+                and not holds_main_content_lxml(element, page_text_length):
+            element.drop_tree()
+    if main_content:
+        root = select_main_content_lxml(root)
+    return "\n".join(text.strip() for text in root.itertext() if text.strip())
+
+
+def select_main_content_lxml(root):
+    for selector in MAIN_CONTENT_XPATHS:
+        candidates = root.xpath(selector)
+        if candidates:
+            # Listing pages have several <article>s; the longest one is the story
+            return max(candidates, key=lambda candidate: len(candidate.text_content()))
+    body = root.find("body")
+    return body if body is not None else root
+
+
+def extract_text_with_soup(content, encoding=None, main_content=False):
+    soup = BeautifulSoup(content, HTML_PARSER, from_encoding=encoding if isinstance(content, bytes) else None)
+    for element in soup.find_all(BOILERPLATE_TAGS):
+        element.decompose()
+    page_text_length = len(soup.get_text())
+    for element in soup.find_all(CHROME_TAGS):
+        if not element.decomposed and element.find_parent(["article", "main"]) is None \
+                and not holds_main_content_soup(element, page_text_length):
+            element.decompose()
+    # Collect first and then decompose, since removing a parent also removes its children
+    for element in [element for element in soup.find_all(True) if element.name not in PROTECTED_TAGS and is_boilerplate(element.attrs)]:
+        if not element.decomposed and not holds_main_content_soup(element, page_text_length):
+            element.decompose()
+    if main_content:
+        soup = select_main_content_soup(soup)
+    return soup.get_text(separator="\n").strip()
+
+
+def select_main_content_soup(soup):
+    for selector in MAIN_CONTENT_SELECTORS:
+        candidates = soup.select(selector)
+        if candidates:
+            return max(candidates, key=lambda candidate: len(candidate.get_text()))
+    return soup.body or soup
@@ -0,0 +1,339 @@
+import email.utils
+import logging
+import os
+import sqlite3
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from sqlite_connections import SQLiteConnections
+
+
+RATE_LIMIT_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS buckets ("
+    " host TEXT PRIMARY KEY,"
+    " tokens REAL NOT NULL,"
+    " updated_at REAL NOT NULL,"
+    " paused_until REAL NOT NULL DEFAULT 0)",
+)
+
+
+class CircuitOpenError(requests.exceptions.RequestException):
+    """
+    Raised instead of sending a request to a host whose circuit breaker is open.
+    """
+
+
+def parse_rate_limits(spec):
+    """
+    Parses per-host rate limits written as "host=rate:burst,host=rate:burst". A rate of 0 means
+    no limit for that host.
+
+    Args:
+        spec (str): The limits, e.g. "www.wikidata.org=5:10,api.crossref.org=10:20".
+
+    Returns:
+        dict: Host to (requests per second, burst size), or to None for unlimited hosts.
+
+    Raises:
+        ValueError: If a rate or burst is not a number, a rate is negative, or a burst is below 1.
+    """
+    limits = {}
+    for entry in filter(None, (part.strip() for part in (spec or "").split(","))):
+        host, _, limit = entry.partition("=")
+        rate, _, burst = limit.partition(":")
+        try:
+            rate, burst = float(rate), float(burst or rate)
+        except ValueError:
+            raise ValueError(f"Invalid rate limit {entry!r}: expected host=rate:burst with numbers") from None
+        if rate < 0:
+            raise ValueError(f"Invalid rate limit {entry!r}: the rate must be positive, or 0 for no limit")
+        if rate == 0:
+            limits[host.strip().lower()] = None
+        elif burst < 1:
+            raise ValueError(f"Invalid rate limit {entry!r}: the burst must be at least 1")
+        else:
+            limits[host.strip().lower()] = (rate, burst)
+    return limits
+
+
+def retry_after_seconds(response, default):
+    """
+    Args:
+        response (Response): A 429 or 503 response.
+        default (float): The wait to use when the server does not say.
+
+    Returns:
+        float: How long the server asked clients to wait.
+    """
+    value = response.headers.get("Retry-After")
+    if not value:
+        return default
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return default
+
+
+class HostRateLimiter:
+    """
+    Token buckets per host, kept in SQLite so every worker process draws from the same buckets.
+    A host can also be paused (after a 429), which holds back every process until the pause ends.
+    """
+
+    def __init__(self, path, limits, default_limit):
+        self.path = path
+        self.limits = limits
+        self.default_limit = default_limit
+        self._connections = SQLiteConnections(path, RATE_LIMIT_SCHEMA, isolation_level=None)
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _connection(self):
+        return self._connections.get()
+
+    def limit_for(self, host):
+        """
+        Args:
+            host (str): The host name.
+
+        Returns:
+            tuple: (requests per second, burst size), or None when the host is not limited.
+        """
+        return self.limits.get(host, self.default_limit)
+
+    def _try_acquire(self, host):
+        # Returns how long to wait before trying again, or 0 if a token was taken
+        rate, burst = self.limit_for(host)
+        connection = self._connection()
+        now = time.time()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            row = connection.execute("SELECT tokens, updated_at, paused_until FROM buckets WHERE host = ?", (host,)).fetchone()
+            tokens, updated_at, paused_until = row if row else (burst, now, 0.0)
+            if paused_until > now:
+                connection.execute("COMMIT")
+                return paused_until - now
+            tokens = min(burst, tokens + (now - updated_at) * rate)
+            wait = 0.0 if tokens >= 1 else (1 - tokens) / rate
+            if wait == 0.0:
+                tokens -= 1
+            connection.execute(
+                "INSERT OR REPLACE INTO buckets (host, tokens, updated_at, paused_until) VALUES (?, ?, ?, ?)",
+                (host, tokens, now, paused_until)
+            )
+            connection.execute("COMMIT")
+            return wait
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+
+    def acquire(self, host):
+        """
+        Blocks until a request to `host` is allowed.
+
+        Args:
+            host (str): The host name.
+
+        Returns:
+            float: The seconds spent waiting.
+        """
+        if self.limit_for(host) is None:
+            return 0.0
+        waited = 0.0
+        while True:
+            try:
+                wait = self._try_acquire(host)
+            except sqlite3.Error as e:
+                # The limiter must never take the service down with it
+                logging.warning(f"Rate limiter unavailable for {host}: {e}")
+                return waited
+            if wait <= 0:
+                return waited
+            time.sleep(wait)
+            waited += wait
+
+    def pause(self, host, seconds):
+        """
+        Holds back every process's requests to `host` for `seconds`.
+
+        Args:
+            host (str): The host name.
+            seconds (float): The pause.
+        """
+        until = time.time() + seconds
+        try:
+            self._connection().execute(
+                "INSERT INTO buckets (host, tokens, updated_at, paused_until) VALUES (?, 0, ?, ?)"
+                " ON CONFLICT(host) DO UPDATE SET tokens = 0, updated_at = excluded.updated_at,"
+                " paused_until = MAX(paused_until, excluded.paused_until)",
+                (host, until, until)
+            )
+        except sqlite3.Error as e:
+            logging.warning(f"Rate limiter unavailable for {host}: {e}")
+
+
+class CircuitBreaker:
+    """
+    Stops calling a host after `failure_threshold` consecutive failures. Once `reset_timeout`
+    has passed a single trial request is let through; its outcome closes or reopens the circuit.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = {}
+        self._opened_at = {}
+        self._trial_in_flight = set()
+        self._lock = threading.Lock()
+
+    def before_request(self, host):
+        """
+        Raises:
+            CircuitOpenError: If the circuit for `host` is open.
+        """
+        with self._lock:
+            opened_at = self._opened_at.get(host)
+            if opened_at is None:
+                return
+            if time.monotonic() - opened_at < self.reset_timeout or host in self._trial_in_flight:
+                raise CircuitOpenError(f"Circuit open for {host} after {self._failures[host]} consecutive failures")
+            self._trial_in_flight.add(host)
+
+    def record(self, host, success):
+        """
+        Args:
+            host (str): The host name.
+            success (bool): Whether the request succeeded.
+        """
+        with self._lock:
+            self._trial_in_flight.discard(host)
+            if success:
+                self._failures.pop(host, None)
+                self._opened_at.pop(host, None)
+                return
+            self._failures[host] = self._failures.get(host, 0) + 1
+            if self._failures[host] >= self.failure_threshold:
+                if host not in self._opened_at:
+                    logging.warning(f"Opening circuit for {host} after {self._failures[host]} consecutive failures")
+                self._opened_at[host] = time.monotonic()
+
+    def state(self):
+        """
+        Returns:
+            dict: Host to 'open' or 'closed', for hosts with recent failures.
+        """
+        with self._lock:
+            return {host: ("open" if host in self._opened_at else "closed") for host in self._failures}
+
+
+class HttpClient:
+    """
+    The one way this service talks to other hosts: pooled keep-alive sessions, per-host token
+    buckets shared by all worker processes, default timeouts, bounded retries of 429/503
+    responses that honor Retry-After (up to `max_retry_after` seconds), and a per-host circuit
+    breaker.
+    """
+
+    RETRY_STATUSES = (429, 503)
+
+    def __init__(self, rate_limiter, timeout=(5, 30), max_retries=4, user_agent=None, pool_size=16, circuit_breaker=None,
+                 max_retry_after=60):
+        self.rate_limiter = rate_limiter
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.max_retry_after = max_retry_after
+        self.user_agent = user_agent
+        self.pool_size = pool_size
+        self.circuit_breaker = circuit_breaker or CircuitBreaker()
+        self._local = threading.local()
+        self._stats = {"requests": 0, "retries": 0, "throttled_seconds": 0.0, "circuit_rejections": 0}
+        self._stats_lock = threading.Lock()
+
+    def _session(self):
+        # Sessions are not safe to share between threads, and their sockets must not cross a fork
+        session = getattr(self._local, 'session', None)
+        if session is None or self._local.pid != os.getpid():
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            if self.user_agent:
+                session.headers["User-Agent"] = self.user_agent
+            self._local.session = session
+            self._local.pid = os.getpid()
+        return session
+
+    def _count(self, name, amount=1):
+        with self._stats_lock:
+            self._stats[name] += amount
+
+    def get(self, url, **kwargs):
+        """
+        Sends a GET request.
+
+        Args:
+            url (str): The URL.
+            **kwargs: Passed to requests (params, headers, stream, timeout...).
+
+        Returns:
+            Response: The response. A 429/503 is returned once the retries are used up, or at
+                once when its Retry-After is longer than `max_retry_after`.
+
+        Raises:
+            CircuitOpenError: If the host's circuit is open.
+            requests.exceptions.RequestException: On connection errors and timeouts.
+        """
+        host = urlsplit(url).hostname or ""
+        kwargs.setdefault("timeout", self.timeout)
+        delay = 1.0
+        for attempt in range(self.max_retries + 1):
+            try:
+                self.circuit_breaker.before_request(host)
+            except CircuitOpenError:
+                self._count("circuit_rejections")
+                raise
+            self._count("throttled_seconds", self.rate_limiter.acquire(host))
+            self._count("requests")
+            try:
+                response = self._session().get(url, **kwargs)
+            except requests.exceptions.RequestException:
+                self.circuit_breaker.record(host, success=False)
+                raise
+            if response.status_code not in self.RETRY_STATUSES:
+                self.circuit_breaker.record(host, success=response.status_code < 500)
+                return response
+            # Throttling is not a failure of the host, but it must slow down every worker
+            self.circuit_breaker.record(host, success=response.status_code == 429)
+            if attempt == self.max_retries:
+                return response
+            wait = retry_after_seconds(response, delay)
+            if wait > self.max_retry_after:
+                # Holding a request thread that long is worse than failing; still slow every
+                # worker down, but only for as long as a retry would have waited
+                logging.warning(f"{host}: received HTTP {response.status_code} asking to wait {wait:.0f} seconds. Giving up on {url}.")
+                self.rate_limiter.pause(host, self.max_retry_after)
+                return response
+            logging.warning(f"{host}: received HTTP {response.status_code}. Pausing all workers for {wait:.1f} seconds.")
+            self.rate_limiter.pause(host, wait)
+            response.close()
+            self._count("retries")
+            delay = min(delay * 2, 60)
+        return response
+
+    def stats(self):
+        """
+        Returns:
+            dict: Request, retry and throttling counters, and the hosts with open circuits.
+        """
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["throttled_seconds"] = round(stats["throttled_seconds"], 1)
+        stats["circuits"] = self.circuit_breaker.state()
+        return stats
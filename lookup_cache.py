@@ -0,0 +1,224 @@
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from sqlite_connections import SQLiteConnections
+
+# Sentinel stored for lookups that returned no match, so they are not retried until they expire
+NEGATIVE_RESULT = {"__negative__": True}
+
+normalize_whitespace_pattern = re.compile(r'\s+')
+
+LOOKUP_CACHE_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS lookup_cache ("
+    " namespace TEXT NOT NULL,"
+    " key TEXT NOT NULL,"
+    " value TEXT NOT NULL,"
+    " expires_at REAL NOT NULL,"
+    " PRIMARY KEY (namespace, key))",
+    "CREATE INDEX IF NOT EXISTS lookup_cache_expiry ON lookup_cache (namespace, expires_at)",
+)
+
+
+def normalize_lookup_text(text):
+    """
+    Normalizes an entity surface form so trivially different spellings share a cache entry.
+
+    Args:
+        text (str): The entity text.
+
+    Returns:
+        str: The casefolded text with collapsed whitespace.
+    """
+    return normalize_whitespace_pattern.sub(' ', text).strip().casefold()
+
+
+class LookupCache:
+    """
+    Two-tier cache for remote lookups: an in-process LRU in front of an on-disk SQLite table.
+
+    Entries expire after `ttl` seconds (`negative_ttl` for "no match" results). The SQLite tier
+    survives restarts and is shared by every process pointing at the same file. Expired rows are
+    purged on the first write of each process and then every `purge_every` stored entries, which
+    also trims the namespace to its `max_disk_entries` rows that expire last.
+    """
+
+    def __init__(self, path, namespace, ttl, negative_ttl=None, max_memory_entries=10000, max_disk_entries=None, purge_every=1000):
+        self.path = path
+        self.namespace = namespace
+        self.ttl = ttl
+        self.negative_ttl = ttl if negative_ttl is None else negative_ttl
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_entries = max_disk_entries
+        self.purge_every = purge_every
+        self._stores_until_purge = 0
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._connections = SQLiteConnections(path, LOOKUP_CACHE_SCHEMA)
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "negative_hits": 0, "misses": 0, "stores": 0, "evictions": 0, "purged": 0}
+        if self.path:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+
+    def _connection(self):
+        return self._connections.get()
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def _remember(self, key, value, expires_at):
+        with self._lock:
+            self._memory[key] = (value, expires_at)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_memory_entries:
+                self._memory.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def get(self, key):
+        """
+        Looks up a key in memory first and then on disk.
+
+        Args:
+            key (str): The cache key.
+
+        Returns:
+            tuple: (found, value). `value` is None for cached negative results.
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if entry[1] > now:
+                    self._memory.move_to_end(key)
+                else:
+                    del self._memory[key]
+                    entry = None
+        if entry is not None:
+            self._count("memory_hits")
+            return self._unwrap(entry[0])
+
+        if self.path:
+            try:
+                row = self._connection().execute(
+                    "SELECT value, expires_at FROM lookup_cache WHERE namespace = ? AND key = ? AND expires_at > ?",
+                    (self.namespace, key, now)
+                ).fetchone()
+            except sqlite3.Error as e:
+                logging.warning(f"Lookup cache read failed ({self.namespace}): {e}")
+                row = None
+            if row is not None:
+                value = json.loads(row[0])
+                self._remember(key, value, row[1])
+                self._count("disk_hits")
+                return self._unwrap(value)
+
+        self._count("misses")
+        return False, None
+
+    def _unwrap(self, value):
+        if value == NEGATIVE_RESULT:
+            self._count("negative_hits")
+            return True, None
+        return True, value
+
+    def set(self, key, value):
+        """
+        Stores a value in both tiers. A None value is stored as a negative result.
+
+        Args:
+            key (str): The cache key.
+            value: Any JSON-serializable value, or None for "no match".
+        """
+        self.set_many([(key, value)])
+
+    def set_many(self, items):
+        """
+        Stores several values in both tiers, writing them to disk in one transaction.
+
+        Args:
+            items (iterable): (key, value) pairs, as passed to set().
+        """
+        rows = []
+        for key, value in items:
+            if value is None:
+                value = NEGATIVE_RESULT
+                expires_at = time.time() + self.negative_ttl
+            else:
+                expires_at = time.time() + self.ttl
+            self._remember(key, value, expires_at)
+            self._count("stores")
+            rows.append((self.namespace, key, json.dumps(value), expires_at))
+        if self.path and rows:
+            try:
+                connection = self._connection()
+                connection.executemany(
+                    "INSERT OR REPLACE INTO lookup_cache (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)", rows
+                )
+                connection.commit()
+            except sqlite3.Error as e:
+                logging.warning(f"Lookup cache write failed ({self.namespace}): {e}")
+        with self._lock:
+            self._stores_until_purge -= len(rows)
+            purge = self._stores_until_purge <= 0
+            if purge:
+                self._stores_until_purge = self.purge_every
+        if purge:
+            try:
+                self.purge_expired()
+            except sqlite3.Error as e:
+                logging.warning(f"Lookup cache purge failed ({self.namespace}): {e}")
+
+    def purge_expired(self):
+        """
+        Deletes expired entries from both tiers, then, if the namespace still has more than
+        `max_disk_entries` rows on disk, the rows that expire soonest. Freed pages are reused by
+        later writes, so the file stops growing rather than shrinking.
+
+        Returns:
+            int: The number of rows removed from disk.
+        """
+        now = time.time()
+        with self._lock:
+            for key in [key for key, (_, expires_at) in self._memory.items() if expires_at <= now]:
+                del self._memory[key]
+        if not self.path:
+            return 0
+        connection = self._connection()
+        removed = connection.execute(
+            "DELETE FROM lookup_cache WHERE namespace = ? AND expires_at <= ?", (self.namespace, now)
+        ).rowcount
+        if self.max_disk_entries is not None:
+            excess = connection.execute(
+                "SELECT COUNT(*) FROM lookup_cache WHERE namespace = ?", (self.namespace,)
+            ).fetchone()[0] - self.max_disk_entries
+            if excess > 0:
+                removed += connection.execute(
+                    "DELETE FROM lookup_cache WHERE rowid IN"
+                    " (SELECT rowid FROM lookup_cache WHERE namespace = ? ORDER BY expires_at LIMIT ?)",
+                    (self.namespace, excess)
+                ).rowcount
+        connection.commit()
+        with self._lock:
+            self._stats["purged"] += removed
+        if removed:
+            logging.info(f"Purged {removed} entries from the {self.namespace} lookup cache")
+        return removed
+
+    def stats(self):
+        """
+        Returns:
+            dict: Hit/miss counters plus the current in-memory size.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats["memory_entries"] = len(self._memory)
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_ratio"] = (stats["memory_hits"] + stats["disk_hits"]) / lookups if lookups else 0.0
+        return stats
@@ -0,0 +1,365 @@
+import bisect
+import contextvars
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from sqlite_connections import SQLiteConnections
+
+# Latency buckets in seconds, from a cache hit to a large PDF
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+# Size buckets for bytes, characters, entities and lookups
+SIZE_BUCKETS = (1, 10, 100, 1000, 10_000, 100_000, 1_000_000, 10_000_000, 100_000_000)
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in labels) + "}"
+
+
+METRICS_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS histogram_series ("
+    " name TEXT NOT NULL,"
+    " labels TEXT NOT NULL,"
+    " buckets TEXT NOT NULL,"
+    " sum REAL NOT NULL,"
+    " count INTEGER NOT NULL,"
+    " PRIMARY KEY (name, labels))",
+)
+
+
+class Histogram:
+    """
+    A Prometheus-style histogram: cumulative bucket counts, a sum and a count per label set.
+
+    Observations are kept in memory; when the registry has a store they are added to it on the
+    next flush, and rendering reads the totals of every process from the store.
+    """
+
+    def __init__(self, name, help_text, buckets, labelnames=(), registry=None):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self.labelnames = tuple(labelnames)
+        self.registry = registry
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        """
+        Args:
+            value (float): The observation.
+            **labels: A value for each of the histogram's label names.
+        """
+        key = tuple((name, labels[name]) for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+        if self.registry is not None:
+            self.registry.maybe_flush()
+
+    def take(self):
+        """
+        Returns:
+            dict: The series observed since the last call, which are forgotten here.
+        """
+        with self._lock:
+            series, self._series = self._series, {}
+        return series
+
+    def merge(self, series):
+        """
+        Adds series (e.g. taken but not stored) back into the in-memory ones.
+
+        Args:
+            series (dict): Label key to [bucket counts, sum, count].
+        """
+        with self._lock:
+            for key, (counts, total, count) in series.items():
+                current = self._series.setdefault(key, [[0] * len(self.buckets), 0.0, 0])
+                current[0] = [a + b for a, b in zip(current[0], counts)]
+                current[1] += total
+                current[2] += count
+
+    def render(self, series=None):
+        """
+        Args:
+            series (dict, optional): The series to render instead of the in-memory ones.
+
+        Returns:
+            list: The histogram in the Prometheus text exposition format, one line per item.
+        """
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        if series is None:
+            with self._lock:
+                series = {key: ([*counts], total, count) for key, (counts, total, count) in self._series.items()}
+        for key, (counts, total, count) in sorted(series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{format_labels(key + (('le', bound),))} {cumulative}")
+            lines.append(f"{self.name}_bucket{format_labels(key + (('le', '+Inf'),))} {count}")
+            lines.append(f"{self.name}_sum{format_labels(key)} {total}")
+            lines.append(f"{self.name}_count{format_labels(key)} {count}")
+        return lines
+
+
+class Registry:
+    """
+    The metrics exposed on /metrics. Without a store each process reports only its own
+    observations; gunicorn workers each serve a share of the scrapes, so the app gives the
+    registry a SQLite store (use_store) where every worker adds its observations and from which
+    every scrape reads the totals of all of them.
+    """
+
+    def __init__(self):
+        self._metrics = []
+        self._connections = None
+        self.flush_interval = 5.0
+        self._flushed_at = time.monotonic()
+        self._flush_lock = threading.Lock()
+
+    def histogram(self, name, help_text, buckets, labelnames=()):
+        histogram = Histogram(name, help_text, buckets, labelnames, self)
+        self._metrics.append(histogram)
+        return histogram
+
+    def use_store(self, path, flush_interval=5.0):
+        """
+        Aggregates the metrics of every process using the same SQLite file.
+
+        Args:
+            path (str): The SQLite file.
+            flush_interval (float): Seconds between writes of a process's new observations.
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connections = SQLiteConnections(path, METRICS_SCHEMA, isolation_level=None)
+        self.flush_interval = flush_interval
+
+    def reset_store(self):
+        """
+        Clears the stored totals, e.g. when the server starts, so they count from zero like the
+        in-memory ones.
+        """
+        if self._connections is not None:
+            self._connections.get().execute("DELETE FROM histogram_series")
+
+    def maybe_flush(self):
+        if self._connections is not None and time.monotonic() - self._flushed_at >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """
+        Adds the observations made in this process since the last flush to the store.
+        """
+        if self._connections is None:
+            return
+        with self._flush_lock:
+            self._flushed_at = time.monotonic()
+            taken = [(histogram, histogram.take()) for histogram in self._metrics]
+            try:
+                connection = self._connections.get()
+                connection.execute("BEGIN IMMEDIATE")
+                try:
+                    for histogram, series in taken:
+                        for key, (counts, total, count) in series.items():
+                            labels = json.dumps(key)
+                            row = connection.execute(
+                                "SELECT buckets, sum, count FROM histogram_series WHERE name = ? AND labels = ?",
+                                (histogram.name, labels)
+                            ).fetchone()
+                            if row is not None:
+                                counts = [a + b for a, b in zip(json.loads(row[0]), counts)]
+                                total += row[1]
+                                count += row[2]
+                            connection.execute(
+                                "INSERT OR REPLACE INTO histogram_series (name, labels, buckets, sum, count) VALUES (?, ?, ?, ?, ?)",
+                                (histogram.name, labels, json.dumps(counts), total, count)
+                            )
+                    connection.execute("COMMIT")
+                except BaseException:
+                    connection.execute("ROLLBACK")
+                    raise
+            except sqlite3.Error as e:
+                logging.warning(f"Could not store metrics, keeping them for the next flush: {e}")
+                for histogram, series in taken:
+                    histogram.merge(series)
+
+    def render(self):
+        """
+        Returns:
+            str: Every metric in the Prometheus text exposition format.
+        """
+        if self._connections is None:
+            return "\n".join(line for metric in self._metrics for line in metric.render()) + "\n"
+        self.flush()
+        stored = {}
+        for name, labels, buckets, total, count in self._connections.get().execute(
+            "SELECT name, labels, buckets, sum, count FROM histogram_series"
+        ):
+            key = tuple(tuple(pair) for pair in json.loads(labels))
+            stored.setdefault(name, {})[key] = (json.loads(buckets), total, count)
+        return "\n".join(line for metric in self._metrics for line in metric.render(stored.get(metric.name, {}))) + "\n"
+
+
+REGISTRY = Registry()
+STAGE_SECONDS = REGISTRY.histogram(
+    "nel_stage_duration_seconds", "Time spent in each pipeline stage per document.", DURATION_BUCKETS, ("stage",)
+)
+STAGE_SIZE = REGISTRY.histogram(
+    "nel_stage_size", "Bytes, characters, entities or lookups handled by a stage per document.", SIZE_BUCKETS, ("stage", "unit")
+)
+REQUEST_SECONDS = REGISTRY.histogram(
+    "nel_request_duration_seconds", "Time to build a response, per route.", DURATION_BUCKETS, ("route",)
+)
+
+
+class StageTimings:
+    """
+    Collects the time spent in each stage while one document (or request) is processed.
+
+    Stages nest: the time of an inner stage is not counted in the stage around it. This keeps
+    the numbers meaningful when stages are lazy generators pulling from each other (NER pulls
+    cleaned paragraphs, which pull PDF pages as they are extracted).
+    """
+
+    def __init__(self):
+        self.seconds = {}
+        self.counts = {}
+        self._stack = []
+        self.started = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name):
+        now = time.perf_counter()
+        if self._stack:
+            outer = self._stack[-1]
+            self.seconds[outer[0]] = self.seconds.get(outer[0], 0.0) + now - outer[1]
+        entry = [name, now]
+        self._stack.append(entry)
+        try:
+            yield
+        finally:
+            now = time.perf_counter()
+            self._stack.remove(entry)
+            self.seconds[name] = self.seconds.get(name, 0.0) + now - entry[1]
+            if self._stack:
+                # The outer stage resumes
+                self._stack[-1][1] = now
+
+    def count(self, stage, unit, amount):
+        key = (stage, unit)
+        self.counts[key] = self.counts.get(key, 0) + amount
+
+    def record(self):
+        """
+        Adds this document's stage totals to the histograms.
+        """
+        for stage, seconds in self.seconds.items():
+            STAGE_SECONDS.observe(seconds, stage=stage)
+        for (stage, unit), amount in self.counts.items():
+            STAGE_SIZE.observe(amount, stage=stage, unit=unit)
+
+    def summary(self):
+        """
+        Returns:
+            dict: The timing block returned to clients: milliseconds and counts per stage.
+        """
+        stages = {stage: {"ms": round(seconds * 1000, 2)} for stage, seconds in self.seconds.items()}
+        for (stage, unit), amount in self.counts.items():
+            stages.setdefault(stage, {"ms": 0.0})[unit] = amount
+        return {"stages": stages, "total_ms": round((time.perf_counter() - self.started) * 1000, 2)}
+
+
+_current_timings = contextvars.ContextVar("stage_timings", default=None)
+
+
+@contextmanager
+def collect_timings():
+    """
+    Collects stage timings for the work done inside the block (on this thread) and adds them to
+    the histograms at the end.
+
+    Yields:
+        StageTimings: The timings being collected.
+    """
+    timings = StageTimings()
+    token = _current_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _current_timings.reset(token)
+        timings.record()
+
+
+def current_timings():
+    """
+    Returns:
+        StageTimings: The timings being collected on this thread, or None.
+    """
+    return _current_timings.get()
+
+
+@contextmanager
+def stage(name):
+    """
+    Times a stage of the document being processed; a no-op outside collect_timings().
+
+    Args:
+        name (str): 'fetch', 'extraction', 'clean_text', 'ner', 'linking' or 'graph_assembly'.
+    """
+    timings = _current_timings.get()
+    if timings is None:
+        yield
+        return
+    with timings.stage(name):
+        yield
+
+
+def count(stage_name, unit, amount):
+    """
+    Records how much a stage handled, e.g. count('fetch', 'bytes', 1024).
+
+    Args:
+        stage_name (str): The stage.
+        unit (str): 'bytes', 'characters', 'entities', 'lookups'...
+        amount (int): The amount.
+    """
+    timings = _current_timings.get()
+    if timings is not None:
+        timings.count(stage_name, unit, amount)
+
+
+def timed_iter(iterable, name):
+    """
+    Times the work a lazy iterable does to produce each item (e.g. extracting a PDF page) as
+    the stage `name`.
+
+    Args:
+        iterable (iterable): The source.
+        name (str): The stage.
+
+    Yields:
+        The items of `iterable`.
+    """
+    iterator = iter(iterable)
+    while True:
+        with stage(name):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
@@ -0,0 +1,218 @@
+import argparse
+import logging
+import os
+import resource
+import time
+
+import numpy
+import spacy
+
+# Components of the en_core_web_* pipelines that nothing in this app reads; only doc.ents is used
+NER_UNUSED_COMPONENTS = ["tagger", "parser", "lemmatizer", "attribute_ruler", "senter"]
+# Static vectors table stored next to the snapshot and memory-mapped at load time
+VECTORS_FILENAME = "vectors.npy"
+
+
+def current_rss_mb():
+    """
+    Returns:
+        float: The resident set size of this process in MB.
+    """
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # Peak rather than current RSS, but the best available without /proc (ru_maxrss is KB on Linux)
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def process_memory_mb(pid="self"):
+    """
+    Reports how much of a process's memory is private and how much is shared with other
+    processes (for a pre-forked worker, the copy-on-write pages inherited from the parent).
+
+    Args:
+        pid (int or str): The process ID, or "self".
+
+    Returns:
+        dict: 'rss', 'pss', 'shared' and 'private' in MB (empty if /proc is unavailable).
+    """
+    fields = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as rollup:
+            for line in rollup:
+                parts = line.split()
+                if len(parts) >= 2 and parts[0].endswith(":") and parts[1].isdigit():
+                    fields[parts[0][:-1]] = int(parts[1]) / 1024
+    except OSError:
+        return {}
+    shared = fields.get("Shared_Clean", 0) + fields.get("Shared_Dirty", 0)
+    return {
+        "rss": round(fields.get("Rss", 0), 1),
+        "pss": round(fields.get("Pss", 0), 1),
+        "shared": round(shared, 1),
+        "private": round(fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0), 1),
+    }
+
+
+def slim_ner_pipeline(model_name):
+    """
+    Loads a spaCy model keeping only what named entity recognition needs.
+
+    Args:
+        model_name (str): The installed model package, e.g. en_core_web_lg.
+
+    Returns:
+        Language: The NER-only pipeline.
+    """
+    nlp = spacy.load(model_name, exclude=NER_UNUSED_COMPONENTS)
+    if "tok2vec" in nlp.pipe_names:
+        # The en_core_web models give ner its own embedding layer; the shared tok2vec then only
+        # feeds the excluded components and is dead weight
+        try:
+            listeners = nlp.get_pipe("tok2vec").listening_components
+        except AttributeError:
+            listeners = ["ner"]
+        if "ner" not in listeners:
+            nlp.remove_pipe("tok2vec")
+    return nlp
+
+
+def load_ner_pipeline(model_name, snapshot_path=None):
+    """
+    Loads the NER pipeline once, from the prebuilt slim snapshot when one exists, and logs
+    how long it took and how much memory it added.
+
+    Args:
+        model_name (str): The installed model package to fall back to.
+        snapshot_path (str, optional): A directory written by build_snapshot.
+
+    Returns:
+        Language: The NER-only pipeline.
+    """
+    rss_before = current_rss_mb()
+    started = time.perf_counter()
+    if snapshot_path and os.path.isdir(snapshot_path):
+        nlp = spacy.load(snapshot_path)
+        attach_mapped_vectors(nlp, os.path.join(snapshot_path, VECTORS_FILENAME))
+        source = snapshot_path
+    else:
+        nlp = slim_ner_pipeline(model_name)
+        source = model_name
+    elapsed = time.perf_counter() - started
+    rss_after = current_rss_mb()
+    logging.info(
+        f"Loaded spaCy pipeline {source} {nlp.pipe_names} in {elapsed:.2f}s; "
+        f"RSS {rss_before:.0f} MB -> {rss_after:.0f} MB"
+    )
+    return nlp
+
+
+def attach_mapped_vectors(nlp, vectors_path):
+    """
+    Points the pipeline's static vectors at a read-only memory map of the table, so every process
+    that loads the snapshot (server workers, nlp.pipe subprocesses) shares one copy through the
+    page cache instead of holding its own.
+
+    Args:
+        nlp (Language): A pipeline loaded from a snapshot written by build_snapshot.
+        vectors_path (str): The .npy file holding the vectors table.
+
+    Returns:
+        bool: Whether the mapped table was attached.
+    """
+    if not os.path.exists(vectors_path):
+        return False
+    vectors = nlp.vocab.vectors
+    table = numpy.load(vectors_path, mmap_mode="r")
+    if vectors.data.ndim != 2 or table.shape[1] != vectors.data.shape[1]:
+        logging.warning(f"Ignoring {vectors_path}: shape {table.shape} does not match the pipeline's vectors")
+        return False
+    vectors.data = table
+    logging.info(f"Memory-mapped {table.shape[0]} x {table.shape[1]} vectors from {vectors_path}")
+    return True
+
+
+def build_snapshot(model_name, snapshot_path):
+    """
+    Serializes the slim NER pipeline so later cold starts skip the excluded components. The
+    vectors table is written separately as a plain .npy file and the snapshot's own copy is left
+    empty, so loading the snapshot maps the table rather than deserializing it.
+
+    Args:
+        model_name (str): The installed model package.
+        snapshot_path (str): The directory to write.
+    """
+    nlp = slim_ner_pipeline(model_name)
+    vectors = nlp.vocab.vectors
+    table = vectors.data
+    if vectors.mode == "default" and table.shape[0]:
+        # Keys and key-to-row mapping stay in the snapshot; only the rows move out
+        vectors.data = table[:0]
+        try:
+            nlp.to_disk(snapshot_path)
+        finally:
+            vectors.data = table
+        numpy.save(os.path.join(snapshot_path, VECTORS_FILENAME), numpy.ascontiguousarray(table))
+    else:
+        nlp.to_disk(snapshot_path)
+    logging.info(f"Wrote slim NER snapshot of {model_name} {nlp.pipe_names} to {snapshot_path}")
+
+
+def compare_startup(model_name, snapshot_path=None):
+    """
+    Logs startup time and memory for the full model and for the slim pipeline. Each variant is
+    loaded in a fresh subprocess so the numbers do not include the previous load.
+
+    Args:
+        model_name (str): The installed model package.
+        snapshot_path (str, optional): A directory written by build_snapshot.
+    """
+    import multiprocessing
+
+    def load(kind):
+        rss_before = current_rss_mb()
+        started = time.perf_counter()
+        if kind == "full":
+            nlp = spacy.load(model_name)
+        elif kind == "slim":
+            nlp = slim_ner_pipeline(model_name)
+        else:
+            nlp = spacy.load(snapshot_path)
+            attach_mapped_vectors(nlp, os.path.join(snapshot_path, VECTORS_FILENAME))
+        logging.info(
+            f"{kind:>8}: {nlp.pipe_names} loaded in {time.perf_counter() - started:.2f}s, "
+            f"RSS +{current_rss_mb() - rss_before:.0f} MB"
+        )
+
+    kinds = ["full", "slim"] + (["snapshot"] if snapshot_path and os.path.isdir(snapshot_path) else [])
+    context = multiprocessing.get_context("fork")
+    for kind in kinds:
+        process = context.Process(target=load, args=(kind,))
+        process.start()
+        process.join()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build and measure the slim NER-only spaCy pipeline.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    snapshot_parser = subparsers.add_parser("build-snapshot", help="Write the slim pipeline to disk.")
+    snapshot_parser.add_argument("path")
+    snapshot_parser.add_argument("--model", default="en_core_web_lg")
+    compare_parser = subparsers.add_parser("compare", help="Report startup time and RSS before and after slimming.")
+    compare_parser.add_argument("--model", default="en_core_web_lg")
+    compare_parser.add_argument("--snapshot")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    if args.command == "build-snapshot":
+        build_snapshot(args.model, args.path)
+    else:
+        compare_startup(args.model, args.snapshot)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+import logging
+import multiprocessing
+import os
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from PyPDF2 import PdfReader
+
+_pdf_executor = None
+_pdf_executor_pid = None
+_pdf_executor_lock = threading.Lock()
+
+
+def start_pdf_executor(workers):
+    """
+    Forks the extraction processes right away. Call it while the process is still
+    single-threaded (gunicorn's post_fork, or before the development server starts): forking
+    once request threads are running can leave a child stuck on a lock (logging, SQLite, the
+    allocator) that another thread held at the time of the fork.
+
+    Args:
+        workers (int): The number of extraction processes; 1 or less starts none.
+
+    Returns:
+        ProcessPoolExecutor: The extraction pool, or None.
+    """
+    global _pdf_executor, _pdf_executor_pid
+    if workers <= 1:
+        return None
+    # fork, not spawn: a spawned child would re-import the server's main module (and the model)
+    executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("fork"))
+    # A fork pool starts all of its processes with its first task
+    executor.submit(len, "").result()
+    with _pdf_executor_lock:
+        _pdf_executor, _pdf_executor_pid = executor, os.getpid()
+    return executor
+
+
+def get_pdf_executor():
+    """
+    Returns:
+        ProcessPoolExecutor: The extraction pool started in this process by start_pdf_executor,
+            or None. No pool is created lazily: by then request threads are running, and neither
+            forking nor spawning (which re-imports the main module, and with it the model) is safe.
+    """
+    with _pdf_executor_lock:
+        return _pdf_executor if _pdf_executor_pid == os.getpid() else None
+
+
+def parse_page_range(page_range, page_count):
+    """
+    Turns a 1-based, inclusive "start-end" (or single "n") page range into page indices.
+
+    Args:
+        page_range (str): The requested range, e.g. "1-10".
+        page_count (int): The number of pages in the document.
+
+    Returns:
+        range: The 0-based page indices to extract.
+    """
+    start, _, end = str(page_range).partition("-")
+    first = max(int(start), 1)
+    last = min(int(end) if end else first, page_count)
+    if last < first:
+        raise ValueError(f"Invalid page range '{page_range}' for a {page_count}-page document")
+    return range(first - 1, last)
+
+
+def extract_pages(pdf_path, page_indices):
+    """
+    Extracts the text of some pages of a PDF. Runs inside a pool process.
+
+    Args:
+        pdf_path (str): The PDF file.
+        page_indices (list): The 0-based pages to extract.
+
+    Returns:
+        list: The text of each page ('' for pages that could not be read).
+    """
+    pdf_reader = PdfReader(pdf_path)
+    texts = []
+    for index in page_indices:
+        try:
+            texts.append(pdf_reader.pages[index].extract_text() or "")
+        except Exception as e:
+            logging.warning(f"Could not extract text from PDF page {index + 1}: {e}")
+            texts.append("")
+    return texts
+
+
+def iter_pdf_pages_text(pdf_content, max_pages=None, page_range=None, workers=1, pages_per_task=8):
+    """
+    Extracts page text from a PDF, yielding pages in order as soon as they are ready.
+
+    Pages are extracted in batches of `pages_per_task` on a process pool, so the first pages can
+    be cleaned and sent to NER while later ones are still being extracted.
+
+    Args:
+        pdf_content (bytes): The PDF document.
+        max_pages (int, optional): Stop after this many pages.
+        page_range (str, optional): A 1-based "start-end" range of pages to extract.
+        workers (int): Extraction processes; 1 or less extracts in the calling thread, as does a
+            process where start_pdf_executor was not called.
+        pages_per_task (int): Pages handed to a pool process at a time.
+
+    Yields:
+        str: The text of the next page.
+    """
+    # Pool processes read the PDF from a temporary file instead of receiving the bytes per task
+    with tempfile.NamedTemporaryFile(suffix=".pdf") as pdf_file:
+        pdf_file.write(pdf_content)
+        pdf_file.flush()
+        page_count = len(PdfReader(pdf_file.name).pages)
+        page_indices = parse_page_range(page_range, page_count) if page_range else range(page_count)
+        if max_pages:
+            page_indices = page_indices[:max_pages]
+        batches = [list(page_indices[start:start + pages_per_task]) for start in range(0, len(page_indices), pages_per_task)]
+        logging.debug(f"Extracting {len(page_indices)} of {page_count} PDF pages in {len(batches)} batches...")
+
+        executor = get_pdf_executor() if workers > 1 and len(batches) > 1 else None
+        if executor is None:
+            results = (extract_pages(pdf_file.name, batch) for batch in batches)
+        else:
+            # map() yields batches in page order while later batches are still running
+            results = executor.map(extract_pages, [pdf_file.name] * len(batches), batches)
+        for texts in results:
+            yield from texts
@@ -0,0 +1,175 @@
+import logging
+import threading
+
+
+class CancelledCall(Exception):
+    """
+    The leader of a call stopped before finishing it (e.g. its client disconnected from a
+    streaming response); a waiter should take the call over rather than fail.
+    """
+
+
+class Call:
+    """
+    One in-flight computation that several callers can wait on.
+    """
+
+    def __init__(self):
+        self._done = threading.Event()
+        self.result = None
+        self.error = None
+
+    def wait(self, timeout=None):
+        """
+        Blocks until the leader finishes the call.
+
+        Args:
+            timeout (float, optional): Seconds to wait at most.
+
+        Returns:
+            The leader's result.
+
+        Raises:
+            Exception: The leader's error, CancelledCall, or TimeoutError.
+        """
+        if not self._done.wait(timeout):
+            raise TimeoutError("Timed out waiting for a coalesced call")
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key: the first caller (the leader) computes the
+    result and every caller that arrives while it is running receives the same result (or error)
+    instead of repeating the work. Once the call finishes the key is forgotten, so later callers
+    start a fresh computation (caches are what remember results).
+
+    If the leader gives up on a call (see cancel()), the callers waiting on it start over and
+    one of them becomes the new leader.
+
+    Calls are coalesced between the threads of one process only.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._stats = {"calls": 0, "executions": 0, "coalesced": 0, "cancelled": 0, "timeouts": 0}
+
+    def begin(self, key):
+        """
+        Joins the in-flight call for `key`, or starts one.
+
+        Args:
+            key: A hashable key.
+
+        Returns:
+            tuple: (whether the caller is the leader, the Call). The leader must end the call
+                with finish(); the others wait on it.
+        """
+        with self._lock:
+            self._stats["calls"] += 1
+            call = self._calls.get(key)
+            if call is not None:
+                self._stats["coalesced"] += 1
+                return False, call
+            call = self._calls[key] = Call()
+            self._stats["executions"] += 1
+            return True, call
+
+    def finish(self, key, call, result=None, error=None):
+        """
+        Ends a call started with begin() and wakes up its waiters.
+
+        Args:
+            key: The key passed to begin().
+            call (Call): The Call returned by begin().
+            result: The result to hand to the waiters.
+            error (Exception, optional): The error to raise in the waiters instead.
+        """
+        with self._lock:
+            if self._calls.get(key) is call:
+                del self._calls[key]
+        call.result = result
+        call.error = error
+        call._done.set()
+
+    def cancel(self, key, call):
+        """
+        Ends a call whose leader stopped without a result. Its waiters get CancelledCall and
+        start over instead of failing with the leader.
+
+        Args:
+            key: The key passed to begin().
+            call (Call): The Call returned by begin().
+        """
+        with self._lock:
+            self._stats["cancelled"] += 1
+        self.finish(key, call, error=CancelledCall(f"The {self.name} call for {key!r} was cancelled by its leader"))
+
+    def wait(self, key, call, timeout=None):
+        """
+        Waits for another caller's call.
+
+        Args:
+            key: The key passed to begin().
+            call (Call): The Call returned by begin().
+            timeout (float, optional): Seconds to wait at most.
+
+        Returns:
+            The leader's result.
+
+        Raises:
+            Exception: The leader's error, CancelledCall, or TimeoutError.
+        """
+        try:
+            return call.wait(timeout)
+        except TimeoutError:
+            with self._lock:
+                self._stats["timeouts"] += 1
+            logging.warning(f"Gave up waiting {timeout}s for the in-flight {self.name} call for {key!r}")
+            raise
+
+    def do(self, key, function, timeout=None):
+        """
+        Runs `function` once for all concurrent callers with the same key.
+
+        Args:
+            key: A hashable key.
+            function (callable): Computes the result.
+            timeout (float, optional): Seconds to wait for another caller's computation; after
+                that the caller computes the result itself.
+
+        Returns:
+            tuple: (the result, whether it was shared from another caller's computation).
+        """
+        while True:
+            leader, call = self.begin(key)
+            if leader:
+                break
+            try:
+                return self.wait(key, call, timeout), True
+            except CancelledCall:
+                continue
+            except TimeoutError:
+                return function(), False
+        try:
+            result = function()
+        except BaseException as e:
+            self.finish(key, call, error=e)
+            raise
+        self.finish(key, call, result=result)
+        return result, False
+
+    def stats(self):
+        """
+        Returns:
+            dict: Calls made, computations run, calls coalesced, and the coalesced ratio.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats["in_flight"] = len(self._calls)
+        stats["coalesced_ratio"] = stats["coalesced"] / stats["calls"] if stats["calls"] else 0.0
+        return stats
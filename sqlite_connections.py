@@ -0,0 +1,45 @@
+import os
+import sqlite3
+import threading
+
+
+class SQLiteConnections:
+    """
+    Hands out one SQLite connection per thread and process for a database file, creating its
+    schema on first use. SQLite connections cannot cross threads or forks, so every store that
+    keeps its state in SQLite goes through one of these instead of sharing a connection.
+    """
+
+    def __init__(self, path, schema=(), row_factory=None, isolation_level=""):
+        """
+        Args:
+            path (str): The database file.
+            schema (iterable): Statements run (and committed) on every new connection, e.g.
+                CREATE TABLE IF NOT EXISTS.
+            row_factory (callable, optional): Set on each connection, e.g. sqlite3.Row.
+            isolation_level (str): Passed to sqlite3.connect; None for autocommit, where the
+                caller issues BEGIN itself.
+        """
+        self.path = path
+        self.schema = tuple(schema)
+        self.row_factory = row_factory
+        self.isolation_level = isolation_level
+        self._local = threading.local()
+
+    def get(self):
+        """
+        Returns:
+            sqlite3.Connection: This thread's connection, opened in WAL mode.
+        """
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=self.isolation_level)
+            if self.row_factory is not None:
+                connection.row_factory = self.row_factory
+            connection.execute("PRAGMA journal_mode=WAL")
+            for statement in self.schema:
+                connection.execute(statement)
+            connection.commit()
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
@@ -0,0 +1,150 @@
+import bisect
+import re
+
+# A paragraph ends at any run of line breaks. '|' also ends one, as in the original cleaning
+# regex: it separates navigation links and table cells, which are not prose
+paragraph_break_pattern = re.compile(r'[\n\r|]+')
+# Whitespace inside a paragraph that normalization changes: runs of several blanks, or any tab
+space_run_pattern = re.compile(r'[\t\f\v ]{2,}|[\t\f\v]')
+BLANKS = ' \t\f\v'
+
+# Paragraphs with fewer words are menus, captions and orphaned words
+MIN_PARAGRAPH_WORDS = 6
+
+
+class Paragraph:
+    """
+    A normalized paragraph (single spaces, no leading or trailing blanks) and the map from its
+    character offsets back to the text it was cut from.
+    """
+
+    __slots__ = ('text', 'start', 'end', '_normalized_offsets', '_source_offsets')
+
+    def __init__(self, text, start, end, anchors):
+        self.text = text
+        self.start = start
+        self.end = end
+        # Offsets are linear between anchors: (normalized offset, source offset) pairs
+        self._normalized_offsets = [normalized for normalized, _ in anchors]
+        self._source_offsets = [source for _, source in anchors]
+
+    def source_offset(self, offset):
+        """
+        Args:
+            offset (int): An offset in `text`.
+
+        Returns:
+            int: The offset of the same character in the source text. A space that replaced a
+                run of blanks maps to the start of the run.
+        """
+        index = bisect.bisect_right(self._normalized_offsets, offset) - 1
+        return self._source_offsets[index] + offset - self._normalized_offsets[index]
+
+    def source_span(self, start, end):
+        """
+        Args:
+            start (int): The start of a span of `text` (e.g. an entity).
+            end (int): The end of the span (exclusive).
+
+        Returns:
+            tuple: (start, end) of the span in the source text.
+        """
+        if end <= start:
+            return self.source_offset(start), self.source_offset(start)
+        return self.source_offset(start), self.source_offset(end - 1) + 1
+
+    def __repr__(self):
+        return f"Paragraph({self.text[:40]!r}, start={self.start}, end={self.end})"
+
+
+def iter_paragraphs(text, min_words=MIN_PARAGRAPH_WORDS, offset=0):
+    """
+    Splits text into normalized paragraphs in one pass, lazily. Blank runs collapse to a single
+    space; paragraphs with fewer than `min_words` words are skipped.
+
+    Only the kept paragraphs are copied, and only paragraphs containing tabs or repeated blanks
+    are rewritten; the rest of the text is scanned by the regex engine without copies.
+
+    Args:
+        text (str): The extracted text of a document (or of one PDF page).
+        min_words (int): The fewest words a paragraph needs to be kept.
+        offset (int): Added to the source offsets, for text that continues an earlier text.
+
+    Yields:
+        Paragraph: The next paragraph to keep.
+    """
+    position = 0
+    for match in paragraph_break_pattern.finditer(text):
+        paragraph = normalize_paragraph(text, position, match.start(), min_words, offset)
+        if paragraph is not None:
+            yield paragraph
+        position = match.end()
+    paragraph = normalize_paragraph(text, position, len(text), min_words, offset)
+    if paragraph is not None:
+        yield paragraph
+
+
+def normalize_paragraph(text, start, end, min_words=MIN_PARAGRAPH_WORDS, offset=0):
+    """
+    Args:
+        text (str): The source text.
+        start (int): Where the paragraph starts in `text`.
+        end (int): Where it ends (exclusive).
+        min_words (int): The fewest words the paragraph needs.
+        offset (int): Added to the source offsets.
+
+    Returns:
+        Paragraph: The normalized paragraph, or None if it has fewer than `min_words` words.
+    """
+    while start < end and text[start] in BLANKS:
+        start += 1
+    while end > start and text[end - 1] in BLANKS:
+        end -= 1
+    if end - start < 2 * min_words - 1:
+        return None
+    segment = text[start:end]
+    anchors = [(0, start + offset)]
+    if space_run_pattern.search(segment) is None:
+        normalized = segment
+    else:
+        parts = []
+        length = 0
+        position = 0
+        for match in space_run_pattern.finditer(segment):
+            parts.append(segment[position:match.start()])
+            parts.append(' ')
+            length += match.start() - position + 1
+            position = match.end()
+            anchors.append((length, start + offset + position))
+        parts.append(segment[position:])
+        normalized = ''.join(parts)
+    # Words are counted as str.split() does (no-break spaces separate words too), but only for
+    # short paragraphs: a paragraph with many spaces has enough words
+    if normalized.count(' ') < 4 * min_words and len(normalized.split()) < min_words:
+        return None
+    return Paragraph(normalized, start + offset, end + offset, anchors)
+
+
+def linkable_text_length(text, enough=None):
+    """
+    The length of an entity's text once punctuation is removed and whitespace is collapsed and
+    trimmed, computed without building that string.
+
+    Args:
+        text (str): The entity text.
+        enough (int, optional): Stop counting once the length reaches this value.
+
+    Returns:
+        int: The length (at most `enough` when it is given).
+    """
+    length = 0
+    pending_space = False
+    for char in text:
+        if char.isalnum() or char == '_':
+            length += 2 if pending_space else 1
+            pending_space = False
+            if enough is not None and length >= enough:
+                return enough
+        elif char.isspace():
+            pending_space = length > 0
+    return length
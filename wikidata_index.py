@@ -0,0 +1,325 @@
+import argparse
+import bz2
+import gzip
+import heapq
+import json
+import logging
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+
+from lookup_cache import normalize_lookup_text
+
+# File layout: MAGIC, sorted "key\tkind\tpopularity\tjson\n" records, little-endian uint64 record
+# offsets, FOOTER. Records sort by (key, rank, id), where rank is (kind, -popularity): kind 0 for
+# a label and 1 for an alias, popularity the entity's sitelink count
+INDEX_MAGIC = b"WDIDX2\n"
+FOOTER = struct.Struct("<QQ")  # offsets table position, record count
+OFFSET = struct.Struct("<Q")
+
+
+def open_dump(path):
+    """
+    Opens a Wikidata JSON dump, transparently handling .gz and .bz2 compression.
+
+    Args:
+        path (str): The dump file path.
+
+    Returns:
+        file: A text-mode file object.
+    """
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8")
+    if path.endswith(".bz2"):
+        return bz2.open(path, "rt", encoding="utf-8")
+    return open(path, "r", encoding="utf-8")
+
+
+def iter_dump_entities(path):
+    """
+    Streams entities from a Wikidata JSON dump (one entity per line inside a JSON array).
+
+    Args:
+        path (str): The dump file path.
+
+    Yields:
+        dict: One Wikidata entity at a time.
+    """
+    with open_dump(path) as dump:
+        for line in dump:
+            line = line.strip().rstrip(",")
+            if not line or line in ("[", "]"):
+                continue
+            yield json.loads(line)
+
+
+def entity_records(entity, language="en"):
+    """
+    Builds the index records (normalized surface form, rank, payload) for a single entity.
+
+    Args:
+        entity (dict): A Wikidata entity from the dump.
+        language (str): The language of labels, aliases and descriptions to index.
+
+    Returns:
+        list: Tuples of (key, rank, payload) where payload has the fields wbsearchentities returns
+            plus the entity's direct 'instance_of' (P31) classes.
+    """
+    label = entity.get("labels", {}).get(language, {}).get("value")
+    if not label:
+        return []
+    payload = {
+        "id": entity["id"],
+        "label": label,
+        "description": entity.get("descriptions", {}).get(language, {}).get("value", ""),
+        "instance_of": [
+            claim["mainsnak"]["datavalue"]["value"]["id"]
+            for claim in entity.get("claims", {}).get("P31", [])
+            if claim.get("mainsnak", {}).get("snaktype") == "value"
+        ],
+    }
+    # Prefer labels over aliases and, within each, entities with more sitelinks (a popularity proxy)
+    popularity = len(entity.get("sitelinks", {}))
+    records = [(normalize_lookup_text(label), (0, -popularity), payload)]
+    seen = {records[0][0]}
+    for alias in entity.get("aliases", {}).get(language, []):
+        key = normalize_lookup_text(alias.get("value", ""))
+        if key and key not in seen:
+            seen.add(key)
+            records.append((key, (1, -popularity), payload))
+    return records
+
+
+def record_sort_key(record):
+    key, rank, payload = record
+    return key, rank, payload["id"]
+
+
+def encode_record(key, rank, payload):
+    kind, negative_popularity = rank
+    return (
+        key.replace("\t", " ").replace("\n", " ") + f"\t{kind}\t{-negative_popularity}\t"
+        + json.dumps(payload, ensure_ascii=False) + "\n"
+    ).encode("utf-8")
+
+
+def write_index(records, index_path):
+    """
+    Writes already-sorted encoded records to an index file atomically.
+
+    Args:
+        records (iterable): Encoded record lines in sort order.
+        index_path (str): The destination path.
+
+    Returns:
+        int: The number of records written.
+    """
+    directory = os.path.dirname(index_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{index_path}.tmp.{os.getpid()}"
+    offsets = []
+    with open(tmp_path, "wb") as index_file:
+        index_file.write(INDEX_MAGIC)
+        position = len(INDEX_MAGIC)
+        for record in records:
+            offsets.append(position)
+            index_file.write(record)
+            position += len(record)
+        for offset in offsets:
+            index_file.write(OFFSET.pack(offset))
+        index_file.write(FOOTER.pack(position, len(offsets)))
+    # Readers keep their old mapping until they reopen, so replacing the file is safe while serving
+    os.replace(tmp_path, index_path)
+    return len(offsets)
+
+
+def build_index(dump_path, index_path, language="en"):
+    """
+    Builds a label/alias index from a Wikidata dump subset.
+
+    Args:
+        dump_path (str): The Wikidata JSON dump (optionally .gz/.bz2).
+        index_path (str): The index file to create.
+        language (str): The language to index.
+
+    Returns:
+        int: The number of records written.
+    """
+    records = []
+    for entity in iter_dump_entities(dump_path):
+        records.extend(entity_records(entity, language))
+    records.sort(key=record_sort_key)
+    count = write_index((encode_record(*record) for record in records), index_path)
+    logging.info(f"Built Wikidata index {index_path} with {count} records.")
+    return count
+
+
+def update_index(index_path, dump_path, language="en"):
+    """
+    Incrementally rebuilds an index: entities present in the dump replace their old records,
+    every other record is streamed through unchanged.
+
+    Args:
+        index_path (str): The existing index file.
+        dump_path (str): A Wikidata dump containing new or changed entities.
+        language (str): The language to index.
+
+    Returns:
+        int: The number of records written.
+    """
+    new_records = []
+    updated_ids = set()
+    for entity in iter_dump_entities(dump_path):
+        updated_ids.add(entity["id"])
+        new_records.extend(entity_records(entity, language))
+    new_records.sort(key=record_sort_key)
+
+    index = WikidataIndex(index_path)
+    try:
+        kept_records = (record for record in index.iter_records() if record[2]["id"] not in updated_ids)
+        # Both inputs are sorted as build_index sorts, so merging on the same (key, rank, id)
+        # order leaves a popular new entity ahead of a less popular one already in the index
+        merged = heapq.merge(kept_records, new_records, key=record_sort_key)
+        count = write_index((encode_record(*record) for record in merged), index_path)
+    finally:
+        index.close()
+    logging.info(f"Updated Wikidata index {index_path}: {len(updated_ids)} entities replaced, {count} records.")
+    return count
+
+
+class WikidataIndex:
+    """
+    Read-only, memory-mapped label/alias index. Lookups binary-search the offsets table,
+    so only the touched pages are read and every process shares them through the page cache.
+    """
+
+    def __init__(self, path, reload_interval=30):
+        self.path = path
+        self.reload_interval = reload_interval
+        self._lock = threading.Lock()
+        self._view = self._open()
+        self._mtime = os.stat(self.path).st_mtime
+        self._checked_at = time.monotonic()
+
+    def _open(self):
+        # The mapping stays valid after the file object is closed
+        with open(self.path, "rb") as index_file:
+            index_map = mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ)
+        if index_map[:len(INDEX_MAGIC)] != INDEX_MAGIC:
+            index_map.close()
+            raise ValueError(f"{self.path} is not a Wikidata index file of this version; rebuild it with wikidata_index.py build")
+        offsets_start, count = FOOTER.unpack_from(index_map, len(index_map) - FOOTER.size)
+        return index_map, offsets_start, count
+
+    def _maybe_reload(self):
+        # Pick up a rebuilt index without restarting the process. The old mapping is left for the
+        # garbage collector so lookups still running against it are not cut off.
+        if time.monotonic() - self._checked_at < self.reload_interval:
+            return
+        with self._lock:
+            self._checked_at = time.monotonic()
+            try:
+                mtime = os.stat(self.path).st_mtime
+                if mtime != self._mtime:
+                    self._view = self._open()
+                    self._mtime = mtime
+                    logging.info(f"Reloaded Wikidata index {self.path}")
+            except (OSError, ValueError) as e:
+                logging.warning(f"Could not reload Wikidata index {self.path}: {e}")
+
+    def __len__(self):
+        return self._view[2]
+
+    @staticmethod
+    def _record_start(view, position):
+        index_map, offsets_start, _ = view
+        return OFFSET.unpack_from(index_map, offsets_start + position * OFFSET.size)[0]
+
+    @staticmethod
+    def _key_at(view, position):
+        start = WikidataIndex._record_start(view, position)
+        return view[0][start:view[0].find(b"\t", start)]
+
+    @staticmethod
+    def _record_at(view, position):
+        start = WikidataIndex._record_start(view, position)
+        end = view[0].find(b"\n", start)
+        key, kind, popularity, payload = view[0][start:end].decode("utf-8").split("\t", 3)
+        return key, (int(kind), -int(popularity)), json.loads(payload)
+
+    def lookup(self, text, limit=1):
+        """
+        Finds the entities whose label or alias matches the given text.
+
+        Args:
+            text (str): The entity text.
+            limit (int): The maximum number of matches.
+
+        Returns:
+            list: Matches with 'id', 'label', 'description' and 'instance_of', best first.
+        """
+        self._maybe_reload()
+        key = normalize_lookup_text(text).encode("utf-8")
+        view = self._view
+        count = view[2]
+        low, high = 0, count
+        while low < high:
+            middle = (low + high) // 2
+            if self._key_at(view, middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        matches = []
+        while low < count and len(matches) < limit and self._key_at(view, low) == key:
+            matches.append(self._record_at(view, low)[2])
+            low += 1
+        return matches
+
+    def iter_records(self):
+        """
+        Yields:
+            tuple: (key, rank, payload) for every record in index order.
+        """
+        view = self._view
+        for position in range(view[2]):
+            yield self._record_at(view, position)
+
+    def close(self):
+        self._view[0].close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build and query the local Wikidata label/alias index.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build_parser = subparsers.add_parser("build", help="Build an index from a Wikidata dump subset.")
+    build_parser.add_argument("dump")
+    build_parser.add_argument("index")
+    build_parser.add_argument("--language", default="en")
+    update_parser = subparsers.add_parser("update", help="Replace the entities found in a dump in an existing index.")
+    update_parser.add_argument("index")
+    update_parser.add_argument("dump")
+    update_parser.add_argument("--language", default="en")
+    lookup_parser = subparsers.add_parser("lookup", help="Look up a surface form.")
+    lookup_parser.add_argument("index")
+    lookup_parser.add_argument("text")
+    lookup_parser.add_argument("--limit", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    if args.command == "build":
+        build_index(args.dump, args.index, args.language)
+    elif args.command == "update":
+        update_index(args.index, args.dump, args.language)
+    else:
+        index = WikidataIndex(args.index)
+        json.dump(index.lookup(args.text, args.limit), sys.stdout, indent=2, ensure_ascii=False)
+        sys.stdout.write("\n")
+        index.close()
+
+
+if __name__ == "__main__":
+    main()